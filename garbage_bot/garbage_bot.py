@@ -1,22 +1,36 @@
 import asyncio
 import logging
+import os
 import sys
 import signal
+import zlib
 import sqlite3
 import json
+import hashlib
 import socket
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta, date
-from typing import List, Dict, Any, Optional, Tuple, Callable
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+from collections import deque, OrderedDict
 from io import BytesIO
 from dataclasses import dataclass
+from urllib.parse import quote
 
 # Librerie Esterne
+import aiohttp
 import gspread
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.service_account import Credentials
 from xhtml2pdf.document import pisaDocument
+from pypdf import PdfReader, PdfWriter
 from neonize.aioze.client import NewAClient
 from neonize.aioze.events import ConnectedEv, MessageEv
 from neonize.proto.Neonize_pb2 import JID
+from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import Message as WAMessage
 
 # --- NETWORK FIX ---
 socket.setdefaulttimeout(60)
@@ -28,13 +42,203 @@ class AppConfig:
     DB_PATH_CONFIG: str = "/data/garbage_bot_config.sqlite"
     CREDENTIALS_FILE: str = "/data/credentials.json"
     DATE_FORMAT: str = "%d/%m/%Y"
+    # Righe per pagina A4 (misurate con xhtml2pdf: ne entrano 38 con titolo e data di aggiornamento; pari per l'alternanza dei colori)
+    PDF_ROWS_PER_PAGE: int = 36
+    # Pagine PDF già renderizzate tenute in memoria
+    PDF_FRAGMENT_CACHE_SIZE: int = 240
+    # Documenti PDF completi tenuti in memoria (per insieme di pagine, non per gruppo)
+    PDF_DOCUMENT_CACHE_SIZE: int = 16
     LOG_LEVEL: int = logging.INFO
     COLOR_PRIMARY: str = "#356854"
     COLOR_ALTERNATE: str = "#f2f2f2"
     ADMIN_NUMBERS: Tuple[str, ...] = ("393508950370", "117584041140339")
+    MAX_PARALLEL_GROUPS: int = 4
+    # Margine prudente rispetto alla conservazione dei media sui server WhatsApp
+    MEDIA_CACHE_TTL_DAYS: int = 14
+    SHEETS_POOL_SIZE: int = 20
+    SHEETS_TIMEOUT_SECONDS: float = 15.0
+    SHEETS_CACHE_FRESH_SECONDS: int = 60
+    SHEETS_CACHE_MAX_STALE_SECONDS: int = 3600
+    BREAKER_FAILURE_THRESHOLD: int = 3
+    BREAKER_COOLDOWN_SECONDS: int = 120
+    # 0 = tutto nel processo principale; N > 0 = lifecycle, reminder e PDF ripartiti su N processi worker
+    WORKERS: int = 0
+    JOB_POLL_SECONDS: float = 0.5
+    JOB_TIMEOUT_SECONDS: float = 120.0
+    LEASE_TTL_SECONDS: int = 90
+    WARMUP_CONCURRENCY: int = 2
+    WARMUP_PRERENDER_PDF: bool = True
+    TRACE_LOG_PATH: str = "/data/garbage_bot_trace.jsonl"
+    SLOW_OP_THRESHOLD_MS: int = 3000
+    SLOW_TRACES_KEPT: int = 50
+    FAST_LANE_COMMANDS: Tuple[str, ...] = ("/oggi", "/prossimi", "/regole", "/info", "/help", "/comandi")
 
 config = AppConfig()
 
+# --- TRACING ---
+_current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_trace", default=None)
+
+class Tracer:
+    """Span leggeri legati a un trace id per comando: log JSON su `Trace`, operazioni lente su `SlowOps`."""
+
+    def __init__(self, slow_threshold_ms: int, keep_slow: int):
+        self.log = logging.getLogger("Trace")
+        self.slow_log = logging.getLogger("SlowOps")
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_traces: deque = deque(maxlen=keep_slow)
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        trace = {"trace_id": uuid.uuid4().hex[:12], "name": name, "started": datetime.now().strftime("%d/%m/%Y %H:%M:%S"), "spans": []}
+        token = _current_trace.set(trace)
+        try:
+            with self.span(name, **attrs) as root:
+                trace["root"] = root
+                yield trace
+        finally:
+            _current_trace.reset(token)
+            if any(sp["ms"] >= self.slow_threshold_ms for sp in trace["spans"]):
+                self.slow_traces.append(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        trace = _current_trace.get()
+        record = {"trace_id": trace["trace_id"] if trace else None, "span": name, "ms": None, **attrs}
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if trace: trace["spans"].append(record)
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            self.log.info(line)
+            if record["ms"] >= self.slow_threshold_ms:
+                self.slow_log.warning(line)
+
+    def recent_slow(self, n: int) -> List[Dict[str, Any]]:
+        return list(self.slow_traces)[-n:]
+
+tracer = Tracer(config.SLOW_OP_THRESHOLD_MS, config.SLOW_TRACES_KEPT)
+
+async def untraced(coro: Awaitable) -> Any:
+    """Per i task in background: il task eredita una copia del contesto, senza questo i suoi span finirebbero nel trace del comando che l'ha avviato."""
+    _current_trace.set(None)
+    return await coro
+
+# --- MODELLO TURNI ---
+class Resident:
+    """Condomino condiviso da tutti i suoi turni nello stesso calendario."""
+    __slots__ = ("name", "phone")
+
+    def __init__(self, name: str, phone: str):
+        self.name = name
+        self.phone = phone
+
+class Shift:
+    """Turno compatto: data come ordinale, bidone come stringa internata, condomino condiviso."""
+    __slots__ = ("day", "bin", "resident")
+
+    def __init__(self, day: int, bin: str, resident: Resident):
+        self.day = day
+        self.bin = bin
+        self.resident = resident
+
+    @property
+    def date(self) -> date:
+        return date.fromordinal(self.day)
+
+    @property
+    def date_str(self) -> str:
+        return self.date.strftime(config.DATE_FORMAT)
+
+    @property
+    def name(self) -> str:
+        return self.resident.name
+
+    @property
+    def phone(self) -> str:
+        return self.resident.phone
+
+    def to_row(self) -> List[str]:
+        return [self.date_str, self.bin, self.name, self.phone]
+
+class ShiftCalendar:
+    """Turni di un foglio, convertiti una sola volta alla lettura."""
+    __slots__ = ("shifts", "residents", "stale_since", "last_day")
+    HEADER = ("Data", "Bidone", "Condomino", "Telefono")
+
+    def __init__(self, shifts: Optional[List[Shift]] = None, residents: Optional[List[Resident]] = None,
+                 stale_since: Optional[datetime] = None, last_day: Optional[int] = None):
+        self.shifts = shifts or []
+        self.residents = residents or []
+        # Data dell'ultima riga datata del foglio, anche senza condomino (festivi, ritiri saltati): è lì che finisce il ciclo
+        self.last_day = last_day
+        # Valorizzato quando Sheets non risponde e i dati arrivano dall'ultima lettura riuscita
+        self.stale_since = stale_since
+
+    @classmethod
+    def from_rows(cls, rows: List[List[str]]) -> "ShiftCalendar":
+        """Converte i valori grezzi (intestazione in prima riga); scarta righe senza data valida o condomino."""
+        if not rows: return cls()
+        header = [str(h).strip() for h in rows[0]]
+        idx = [header.index(h) if h in header else None for h in cls.HEADER]
+        cell = lambda row, i: str(row[i]).strip() if i is not None and i < len(row) else ""
+
+        residents: Dict[Tuple[str, str], Resident] = {}
+        shifts: List[Shift] = []
+        skipped = 0
+        last_day = None
+        for row in rows[1:]:
+            d, b, c, t = (cell(row, i) for i in idx)
+            if not d: continue
+            try:
+                day = datetime.strptime(d, config.DATE_FORMAT).toordinal()
+            except ValueError:
+                skipped += 1
+                continue
+            last_day = day
+            if not c: continue
+            resident = residents.get((c, t))
+            if resident is None:
+                resident = residents[(c, t)] = Resident(c, t)
+            shifts.append(Shift(day, sys.intern(b), resident))
+        if skipped:
+            logging.getLogger("ShiftCalendar").warning(f"⚠️ {skipped} righe con data non valida ignorate.")
+        return cls(shifts, list(residents.values()), last_day=last_day)
+
+    def __len__(self) -> int:
+        return len(self.shifts)
+
+    @property
+    def last_date(self) -> Optional[date]:
+        return date.fromordinal(self.last_day) if self.last_day is not None else None
+
+    def __iter__(self):
+        return iter(self.shifts)
+
+    def __getitem__(self, i):
+        return self.shifts[i]
+
+    def on(self, day: date) -> List[Shift]:
+        d = day.toordinal()
+        return [s for s in self.shifts if s.day == d]
+
+    def since(self, day: date) -> List[Shift]:
+        d = day.toordinal()
+        return [s for s in self.shifts if s.day >= d]
+
+    def until(self, day: date) -> List[Shift]:
+        d = day.toordinal()
+        return [s for s in self.shifts if s.day <= d]
+
+    def between(self, start: Optional[date], end: Optional[date]) -> List[Shift]:
+        lo = start.toordinal() if start else 0
+        hi = end.toordinal() if end else date.max.toordinal()
+        return [s for s in self.shifts if lo <= s.day <= hi]
+
 # --- REPOSITORY ---
 class ConfigRepository:
     def __init__(self, db_path: str):
@@ -42,10 +246,12 @@ class ConfigRepository:
         self._init_db()
 
     def _get_connection(self) -> sqlite3.Connection:
-        return sqlite3.connect(self.db_path)
+        # Il DB è condiviso tra processo principale e worker
+        return sqlite3.connect(self.db_path, timeout=10)
 
     def _init_db(self):
         with self._get_connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS group_configs (
                     jid TEXT PRIMARY KEY,
@@ -55,10 +261,40 @@ class ConfigRepository:
                     jid_data BLOB
                 )
             ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS media_cache (
+                    sha256 TEXT PRIMARY KEY,
+                    message BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    shard INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    result BLOB,
+                    error TEXT,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_shard_status ON jobs (shard, status)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
 
     def recreate_tables(self):
         with self._get_connection() as conn:
             conn.execute('DROP TABLE IF EXISTS group_configs')
+            conn.execute('DROP TABLE IF EXISTS media_cache')
+            conn.execute('DROP TABLE IF EXISTS jobs')
+            conn.execute('DROP TABLE IF EXISTS leases')
         self._init_db()
 
     def upsert_config(self, jid_obj: JID, sheet_url: str, group_link: str, group_name: str = ""):
@@ -91,7 +327,314 @@ class ConfigRepository:
             cur = conn.execute('SELECT jid, sheet_url, group_link, group_name, jid_data FROM group_configs')
             return cur.fetchall()
 
+    def get_media(self, sha256: str, max_age: float) -> Optional[bytes]:
+        with self._get_connection() as conn:
+            cur = conn.execute('SELECT message FROM media_cache WHERE sha256 = ? AND created_at > ?', (sha256, time.time() - max_age))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    def put_media(self, sha256: str, message: bytes, max_age: float):
+        now = time.time()
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM media_cache WHERE created_at <= ?', (now - max_age,))
+            conn.execute('INSERT OR REPLACE INTO media_cache (sha256, message, created_at) VALUES (?, ?, ?)', (sha256, message, now))
+
+    def delete_media(self, sha256: str):
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM media_cache WHERE sha256 = ?', (sha256,))
+
+    # --- CODA JOB / LEASE ---
+    def enqueue_job(self, shard: int, kind: str, payload: str) -> int:
+        with self._get_connection() as conn:
+            cur = conn.execute('INSERT INTO jobs (shard, kind, payload, updated_at) VALUES (?, ?, ?, ?)', (shard, kind, payload, time.time()))
+            return cur.lastrowid
+
+    def claim_job(self, shard: int) -> Optional[Tuple[int, str, str]]:
+        # Passaggio pending -> running condizionato: se un altro processo l'ha già preso (o annullato) si passa al successivo
+        with self._get_connection() as conn:
+            rows = conn.execute("SELECT id, kind, payload FROM jobs WHERE shard = ? AND status = 'pending' ORDER BY id LIMIT 5", (shard,)).fetchall()
+            for row in rows:
+                cur = conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'pending'", (time.time(), row[0]))
+                if cur.rowcount == 1:
+                    return row
+            return None
+
+    def cancel_job(self, job_id: int) -> bool:
+        """Annulla un job solo se nessun worker l'ha ancora preso."""
+        with self._get_connection() as conn:
+            cur = conn.execute("DELETE FROM jobs WHERE id = ? AND status = 'pending'", (job_id,))
+            return cur.rowcount == 1
+
+    def finish_job(self, job_id: int, result: Optional[bytes] = None, error: Optional[str] = None):
+        with self._get_connection() as conn:
+            conn.execute('UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?',
+                         ('error' if error else 'done', result, error, time.time(), job_id))
+
+    def get_job(self, job_id: int) -> Optional[Tuple[str, Optional[bytes], Optional[str]]]:
+        with self._get_connection() as conn:
+            return conn.execute('SELECT status, result, error FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def delete_job(self, job_id: int):
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def requeue_running_jobs(self, shard: int) -> int:
+        """Rimette in coda i job lasciati a metà da un worker terminato. Va chiamato solo da chi detiene il lease dello shard."""
+        with self._get_connection() as conn:
+            cur = conn.execute("UPDATE jobs SET status = 'pending', updated_at = ? WHERE shard = ? AND status = 'running'", (time.time(), shard))
+            return cur.rowcount
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Prende o rinnova il lease `name`; False se è di un'altra istanza e non ancora scaduto."""
+        now = time.time()
+        with self._get_connection() as conn:
+            conn.execute('''
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            ''', (name, holder, now + ttl, now))
+            row = conn.execute('SELECT holder FROM leases WHERE name = ?', (name,)).fetchone()
+            return bool(row) and row[0] == holder
+
+    def release_lease(self, name: str, holder: str):
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+
+async def db_call(fn: Callable, *args) -> Any:
+    """Chiamata al repository fuori dall'event loop: con il DB condiviso tra processi una scrittura può attendere il lock fino a 10s."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+class Lease:
+    """Lease su SQLite rinnovato da un heartbeat: al più un detentore alla volta, tra processi e istanze."""
+
+    def __init__(self, repo: ConfigRepository, name: str, holder: str, ttl: float):
+        self.repo = repo
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self.log = logging.getLogger("Lease")
+        self._valid_until = 0.0
+
+    @property
+    def held(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def renew(self) -> bool:
+        started = time.monotonic()
+        try:
+            ok = await db_call(self.repo.acquire_lease, self.name, self.holder, self.ttl)
+        except sqlite3.Error as e:
+            self.log.warning(f"Rinnovo lease '{self.name}' fallito: {e}")
+            # Finché non scade resta nostro: non si perde per un singolo lock del DB
+            return self.held
+        # Margine di un terzo del TTL rispetto alla scadenza registrata nel DB
+        self._valid_until = started + self.ttl * 2 / 3 if ok else 0.0
+        return ok
+
+    async def keep_alive(self, on_lost: Optional[Callable[[], None]] = None):
+        while True:
+            was_held = self.held
+            if not await self.renew() and was_held:
+                self.log.warning(f"Lease '{self.name}' perso")
+                if on_lost: on_lost()
+            await asyncio.sleep(self.ttl / 6)
+
+    def release(self):
+        self._valid_until = 0.0
+        try:
+            self.repo.release_lease(self.name, self.holder)
+        except sqlite3.Error as e:
+            self.log.warning(f"Rilascio lease '{self.name}' fallito: {e}")
+
+# --- DISPATCHER ---
+class CommandDispatcher:
+    """Una coda per chat: i comandi dello stesso gruppo girano in serie, gruppi diversi in parallelo (max `max_parallel`)."""
+
+    def __init__(self, max_parallel: int):
+        self.log = logging.getLogger("CommandDispatcher")
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._queues: Dict[str, deque] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._fast_tasks: set = set()
+
+    def submit(self, key: str, job: Callable[[], Awaitable[Any]], fast: bool = False) -> asyncio.Future:
+        """Accoda `job` sulla coda `key` (o lo esegue subito se `fast`) e restituisce il future del risultato."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if fast:
+            task = asyncio.create_task(self._run(job, future))
+            self._fast_tasks.add(task)
+            task.add_done_callback(self._fast_tasks.discard)
+            return future
+
+        queue = self._queues.setdefault(key, deque())
+        queue.append((job, future))
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        return future
+
+    def pending(self, key: str) -> int:
+        return len(self._queues.get(key, ()))
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._workers or self._fast_tasks)
+
+    async def _drain(self, key: str):
+        queue = self._queues[key]
+        try:
+            while queue:
+                job, future = queue.popleft()
+                async with self._semaphore:
+                    await self._run(job, future)
+        finally:
+            self._workers.pop(key, None)
+            if not queue:
+                self._queues.pop(key, None)
+
+    async def _run(self, job: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        try:
+            result = await job()
+            if not future.done(): future.set_result(result)
+        except Exception as e:
+            self.log.exception(f"❌ Errore job: {e}")
+            if not future.done(): future.set_exception(e)
+            # Il chiamante può ignorare il future: evitiamo il warning "exception never retrieved"
+            future.exception()
+
+# --- SHEETS HTTP CLIENT ---
+class SheetsApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Sheets API {status}: {message}")
+        self.status = status
+
+class AsyncSheetsClient:
+    """Client asyncio per le API Sheets v4: una sola sessione HTTP keep-alive condivisa da tutte le richieste."""
+    BASE_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+
+    def __init__(self, credentials_file: str, scopes: List[str], pool_size: int, timeout: float):
+        self.credentials_file = credentials_file
+        self._scopes = scopes
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._creds: Optional[Credentials] = None
+        self._token_lock = asyncio.Lock()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._pool_size, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self._timeout)
+            )
+        return self._session
+
+    async def _get_token(self) -> str:
+        async with self._token_lock:
+            if self._creds is None:
+                self._creds = Credentials.from_service_account_file(self.credentials_file, scopes=self._scopes)
+            if not self._creds.valid:
+                # Il refresh è sincrono ma avviene circa una volta l'ora
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self._creds.refresh, GoogleAuthRequest())
+            return self._creds.token
+
+    async def _request(self, op: str, method: str, path: str, params: Optional[List[Tuple[str, str]]] = None, body: Optional[Dict] = None) -> Dict[str, Any]:
+        with tracer.span(f"sheets.{op}"):
+            headers = {"Authorization": f"Bearer {await self._get_token()}"}
+            session = self._get_session()
+            async with session.request(method, f"{self.BASE_URL}/{path}", params=params, json=body, headers=headers) as resp:
+                data = await resp.json(content_type=None) or {}
+                if resp.status >= 400:
+                    raise SheetsApiError(resp.status, data.get("error", {}).get("message", resp.reason))
+                return data
+
+    @staticmethod
+    def _range(a1: str) -> str:
+        return quote(a1, safe="")
+
+    async def get_metadata(self, spreadsheet_id: str, fields: str = "sheets.properties") -> Dict[str, Any]:
+        return await self._request("get_metadata", "GET", spreadsheet_id, params=[("fields", fields)])
+
+    async def values_get(self, spreadsheet_id: str, a1: str) -> List[List[str]]:
+        data = await self._request("values_get", "GET", f"{spreadsheet_id}/values/{self._range(a1)}")
+        return data.get("values", [])
+
+    async def values_batch_get(self, spreadsheet_id: str, ranges: List[str]) -> List[List[List[str]]]:
+        data = await self._request("values_batch_get", "GET", f"{spreadsheet_id}/values:batchGet", params=[("ranges", r) for r in ranges])
+        return [vr.get("values", []) for vr in data.get("valueRanges", [])]
+
+    async def values_append(self, spreadsheet_id: str, a1: str, rows: List[List[Any]]) -> Dict[str, Any]:
+        params = [("valueInputOption", "RAW"), ("insertDataOption", "INSERT_ROWS")]
+        return await self._request("values_append", "POST", f"{spreadsheet_id}/values/{self._range(a1)}:append", params=params, body={"values": rows})
+
+    async def values_update(self, spreadsheet_id: str, a1: str, rows: List[List[Any]]) -> Dict[str, Any]:
+        params = [("valueInputOption", "RAW")]
+        return await self._request("values_update", "PUT", f"{spreadsheet_id}/values/{self._range(a1)}", params=params, body={"values": rows})
+
+    async def values_clear(self, spreadsheet_id: str, a1: str) -> Dict[str, Any]:
+        return await self._request("values_clear", "POST", f"{spreadsheet_id}/values/{self._range(a1)}:clear", body={})
+
+    async def batch_update(self, spreadsheet_id: str, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return await self._request("batch_update", "POST", f"{spreadsheet_id}:batchUpdate", body={"requests": requests})
+
+    async def open(self):
+        await self._get_token()
+        self._get_session()
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
 # --- SHEET SERVICE ---
+@dataclass
+class SheetTail:
+    """Coda di un foglio: data e condomino dell'ultima riga (data None se non valida), prima data e fogli presenti nello spreadsheet."""
+    last_date: Optional[date]
+    last_resident: str
+    first_date: Optional[str]
+    worksheets: Tuple[str, ...]
+    has_rows: bool = False
+
+    def has_worksheet(self, title: str) -> bool:
+        return title in self.worksheets
+
+class SheetUnavailableError(Exception):
+    """Google Sheets non raggiungibile e nessun dato precedente da servire."""
+
+class CircuitBreaker:
+    """Per spreadsheet: dopo `threshold` errori consecutivi smette di chiamare Sheets finché una sonda non va a buon fine."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """Registra un errore; True se il circuito si è appena aperto."""
+        self.failures += 1
+        if self.failures >= self.threshold and not self.is_open:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+@dataclass
+class _CacheEntry:
+    value: Any
+    fetched_at: datetime
+    monotonic: float
+
 class SheetService:
     def __init__(self, credentials_file: str):
         self.credentials_file = credentials_file
@@ -100,70 +643,306 @@ class SheetService:
             "https://www.googleapis.com/auth/spreadsheets",
             "https://www.googleapis.com/auth/drive"
         ]
-
-    def _get_client(self):
-        creds = Credentials.from_service_account_file(
-            self.credentials_file, 
-            scopes=self._scope
-        )
-        return gspread.authorize(creds)
-
-    async def get_records(self, sheet_url: str, worksheet_name: str = "Calendario") -> List[Dict[str, Any]]:
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self._get_records_sync, sheet_url, worksheet_name)
-
-    def _get_records_sync(self, sheet_url: str, worksheet_name: str) -> List[Dict[str, Any]]:
+        self.api = AsyncSheetsClient(credentials_file, self._scope, config.SHEETS_POOL_SIZE, config.SHEETS_TIMEOUT_SECONDS)
+        # Ultimi dati letti con successo e stato del circuito, per spreadsheet
+        self._cache: Dict[Tuple[str, str], _CacheEntry] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._revalidating: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @staticmethod
+    def _spreadsheet_id(sheet_url: str) -> str:
+        return gspread.utils.extract_id_from_url(sheet_url)
+
+    # --- CIRCUIT BREAKER / CACHE ---
+    def _breaker(self, sid: str) -> CircuitBreaker:
+        breaker = self._breakers.get(sid)
+        if breaker is None:
+            breaker = self._breakers[sid] = CircuitBreaker(config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_COOLDOWN_SECONDS)
+        return breaker
+
+    def _ensure_probe(self, sid: str, breaker: CircuitBreaker):
+        if breaker.probe is None or breaker.probe.done():
+            breaker.probe = asyncio.create_task(untraced(self._probe(sid, breaker)))
+
+    async def _probe(self, sid: str, breaker: CircuitBreaker):
+        # Un'unica sonda per spreadsheet: finché non risponde, nessun'altra chiamata parte
+        while breaker.is_open:
+            await asyncio.sleep(max(0.0, breaker.opened_at + breaker.cooldown - time.monotonic()))
+            try:
+                await self.api.get_metadata(sid, fields="spreadsheetId")
+                breaker.record_success()
+                self.log.info(f"✅ Google Sheets di nuovo raggiungibile ({sid})")
+            except Exception as e:
+                breaker.opened_at = time.monotonic()
+                self.log.warning(f"🔌 Sonda fallita ({sid}): {e}")
+
+    async def _guarded(self, sid: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Chiama Sheets rispettando il circuito; solleva SheetUnavailableError se è aperto o la chiamata fallisce."""
+        breaker = self._breaker(sid)
+        if breaker.is_open:
+            self._ensure_probe(sid, breaker)
+            raise SheetUnavailableError(f"Circuito aperto per {sid}")
         try:
-            gc = self._get_client()
-            ws = gc.open_by_url(sheet_url).worksheet(worksheet_name)
-            return ws.get_all_records()
+            value = await fetch()
+        except SheetsApiError as e:
+            if 400 <= e.status < 500 and e.status != 429:
+                raise  # Errore del foglio (es. scheda mancante), non di disponibilità
+            self._record_failure(sid, breaker)
+            raise SheetUnavailableError(str(e)) from e
         except Exception as e:
+            self._record_failure(sid, breaker)
+            raise SheetUnavailableError(str(e) or type(e).__name__) from e
+        breaker.record_success()
+        return value
+
+    def _record_failure(self, sid: str, breaker: CircuitBreaker):
+        if breaker.record_failure():
+            self.log.warning(f"🔌 Circuito aperto per {sid} dopo {breaker.failures} errori: pausa di {breaker.cooldown}s")
+            self._ensure_probe(sid, breaker)
+
+    async def _refresh(self, sid: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await self._guarded(sid, fetch)
+        self._cache[(sid, key)] = _CacheEntry(value, datetime.now(), time.monotonic())
+        return value
+
+    def _revalidate(self, sid: str, key: str, fetch: Callable[[], Awaitable[Any]]):
+        task = self._revalidating.get((sid, key))
+        if task and not task.done(): return
+
+        async def run():
+            try:
+                await self._refresh(sid, key, fetch)
+            except SheetUnavailableError as e:
+                self.log.warning(f"Aggiornamento in background fallito ({key}): {e}")
+            finally:
+                self._revalidating.pop((sid, key), None)
+        self._revalidating[(sid, key)] = asyncio.create_task(untraced(run()))
+
+    async def _cached_read(self, sid: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[datetime]]:
+        """Stale-while-revalidate: restituisce (valore, data dell'ultima lettura se il dato è di ripiego)."""
+        entry = self._cache.get((sid, key))
+        if entry:
+            age = time.monotonic() - entry.monotonic
+            if age <= config.SHEETS_CACHE_FRESH_SECONDS:
+                return entry.value, None
+            if self._breaker(sid).is_open:
+                self._ensure_probe(sid, self._breaker(sid))
+                return entry.value, entry.fetched_at
+            if age <= config.SHEETS_CACHE_MAX_STALE_SECONDS:
+                self._revalidate(sid, key, fetch)
+                return entry.value, None
+        try:
+            return await self._refresh(sid, key, fetch), None
+        except SheetUnavailableError:
+            if entry: return entry.value, entry.fetched_at
+            raise
+
+    def invalidate(self, sheet_url: str):
+        """Da chiamare dopo ogni scrittura del bot sullo spreadsheet."""
+        sid = self._spreadsheet_id(sheet_url)
+        for k in [k for k in self._cache if k[0] == sid]:
+            del self._cache[k]
+
+    def ensure_available(self, sheet_url: str):
+        sid = self._spreadsheet_id(sheet_url)
+        breaker = self._breaker(sid)
+        if breaker.is_open:
+            self._ensure_probe(sid, breaker)
+            raise SheetUnavailableError(f"Circuito aperto per {sid}")
+
+    @staticmethod
+    def stale_note(since: Optional[datetime]) -> str:
+        if not since: return ""
+        return f"\n\n⚠️ _Google Sheets non raggiungibile: dati aggiornati al {since.strftime('%d/%m %H:%M')}_"
+
+    # --- LETTURE ---
+    async def get_records(self, sheet_url: str, worksheet_name: str = "Calendario", fresh: bool = False) -> ShiftCalendar:
+        """Turni del foglio. Con `fresh` legge sempre da Sheets (per le scritture); solleva SheetUnavailableError senza dati."""
+        sid = self._spreadsheet_id(sheet_url)
+
+        async def fetch() -> ShiftCalendar:
+            return ShiftCalendar.from_rows(await self.api.values_get(sid, f"'{worksheet_name}'"))
+
+        try:
+            if fresh:
+                return await self._refresh(sid, f"records:{worksheet_name}", fetch)
+            calendar, stale_since = await self._cached_read(sid, f"records:{worksheet_name}", fetch)
+        except SheetsApiError as e:
             self.log.error(f"Errore download dati: {e}")
-            return []
+            return ShiftCalendar()
+        if stale_since:
+            return ShiftCalendar(calendar.shifts, calendar.residents, stale_since=stale_since, last_day=calendar.last_day)
+        return calendar
+
+    def cached_records(self, sheet_url: str, worksheet_name: str = "Calendario") -> Optional[ShiftCalendar]:
+        """Ultima copia letta con successo, marcata come non aggiornata; None se non c'è."""
+        entry = self._cache.get((self._spreadsheet_id(sheet_url), f"records:{worksheet_name}"))
+        if entry is None: return None
+        calendar = entry.value
+        return ShiftCalendar(calendar.shifts, calendar.residents, stale_since=entry.fetched_at, last_day=calendar.last_day)
+
+    async def get_tail(self, sheet_url: str, worksheet_name: str = "Calendario") -> SheetTail:
+        # Mai da cache: il lifecycle non deve agire su dati mancanti o vecchi
+        sid = self._spreadsheet_id(sheet_url)
+        return await self._guarded(sid, lambda: self._fetch_tail(sid, worksheet_name))
+
+    async def _fetch_tail(self, sid: str, worksheet_name: str) -> SheetTail:
+        meta = await self.api.get_metadata(sid)
+        titles = tuple(sh["properties"]["title"] for sh in meta.get("sheets", []))
+        if worksheet_name not in titles:
+            return SheetTail(None, "", None, titles)
+
+        # Sonda sulla sola colonna Data per trovare l'ultima riga, poi lettura di intestazione + ultima riga
+        dates = await self.api.values_get(sid, f"'{worksheet_name}'!A:A")
+        n = len(dates)
+        if n < 2:
+            return SheetTail(None, "", None, titles)
+        header, last = await self.api.values_batch_get(sid, [f"'{worksheet_name}'!A1:D1", f"'{worksheet_name}'!A{n}:D{n}"])
+        # Riga grezza: conta solo la data, il condomino può mancare (festivi, ritiri saltati)
+        header = [h.strip() for h in header[0]] if header else []
+        row = last[0] if last else []
+        try:
+            last_date = datetime.strptime(row[0].strip(), config.DATE_FORMAT).date()
+        except (ValueError, IndexError):
+            last_date = None
+        c = header.index("Condomino") if "Condomino" in header else 2
+        last_resident = row[c].strip() if c < len(row) else ""
+        first_date = dates[1][0] if dates[1] else None
+        return SheetTail(last_date, last_resident, first_date, titles, has_rows=True)
+
+    async def get_residents(self, sheet_url: str) -> List[tuple]:
+        # Usato solo prima di scrivere: sempre letto da Sheets
+        sid = self._spreadsheet_id(sheet_url)
+        raw = await self._guarded(sid, lambda: self.api.values_get(sid, "'Impostazioni'!A2:B1000"))
+        return [(r[0], r[1] if len(r) > 1 else "") for r in raw if r and r[0].strip()]
 
-    async def get_rules(self, sheet_url: str) -> str:
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self._get_rules_sync, sheet_url)
+    async def get_rules(self, sheet_url: str, fresh: bool = False) -> str:
+        sid = self._spreadsheet_id(sheet_url)
 
-    def _get_rules_sync(self, sheet_url: str) -> str:
-        try:
-            gc = self._get_client()
-            sheet = gc.open_by_url(sheet_url).worksheet("Regole")
-            rows = sheet.get_all_values()
+        async def fetch() -> str:
+            rows = await self.api.values_get(sid, "'Regole'")
             return "\n".join([" ".join([c for c in row if c.strip()]) for row in rows if any(row)])
-        except Exception:
+
+        try:
+            if fresh:
+                return await self._refresh(sid, "rules", fetch)
+            rules, stale_since = await self._cached_read(sid, "rules", fetch)
+            return rules + self.stale_note(stale_since)
+        except (SheetUnavailableError, SheetsApiError):
             return "⚠️ Impossibile recuperare le regole."
 
+    async def open_sessions(self):
+        """Prepara token e sessione HTTP prima del primo comando."""
+        await self.api.open()
+
+    async def close(self):
+        await self.api.close()
+
 # --- CALENDAR SERVICE ---
 class CalendarService:
     def __init__(self, sheet_service: SheetService):
         self.sheet = sheet_service
         self.log = logging.getLogger("CalendarService")
+        # PDF già assemblati per digest delle pagine: stesse pagine -> stessi byte, così il media caricato su WhatsApp si può riusare
+        self._pdf_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        # Pagine già renderizzate, per hash del contenuto (LRU condivisa tra gruppi)
+        self._fragments: "OrderedDict[str, bytes]" = OrderedDict()
+
+    async def _run_sync(self, fn: Callable, *args):
+        """Esegue un helper sincrono (xhtml2pdf, pypdf) nell'executor, tracciato con il suo nome."""
+        loop = asyncio.get_running_loop()
+        with tracer.span(fn.__name__):
+            return await loop.run_in_executor(None, fn, *args)
 
     # --- PDF ---
-    def _generate_html_template(self, dati: List[Dict], title: str = "Calendario Turni") -> str:
-        data_gen = datetime.now().strftime("%d/%m/%Y %H:%M")
+    def _generate_html_template(self, shifts: List[Shift], title: Optional[str] = None, footer: Optional[str] = None) -> str:
+        """Una pagina A4 del calendario, con titolo (prima pagina) e data di aggiornamento (ultima)."""
         rows_html = ""
-        for i, row in enumerate(dati):
-            d = str(row.get('Data', '')).strip()
-            b = str(row.get('Bidone', '')).strip()
-            c = str(row.get('Condomino', '')).strip()
-            if not d or not c: continue
+        for i, shift in enumerate(shifts):
+            d, b, c = shift.date_str, shift.bin, shift.name
             bg_color = config.COLOR_ALTERNATE if i % 2 == 0 else "#ffffff"
             style_td = f"background-color: {bg_color}; text-align: center; vertical-align: middle; padding-top: 4px; padding-bottom: 4px;"
             rows_html += f'<tr><td style="{style_td}">{d}</td><td style="{style_td}">{b}</td><td style="{style_td}">{c}</td></tr>\n'
-        return f"""<html><head><meta charset="UTF-8"><style>@page {{ size: a4; margin: 1cm; }} table {{ border-collapse: collapse; width: 100%; }} th, td {{ border: 1px solid #dddddd; padding: 4px; text-align: center; vertical-align: middle; font-family: Arial, sans-serif; font-size: 10pt; line-height: 1.2; }} th {{ background-color: {config.COLOR_PRIMARY} !important; color: white !important; padding-top: 6px; padding-bottom: 6px; }}</style></head><body><h1 style="color: {config.COLOR_PRIMARY}; text-align: center; font-family: Arial; font-size: 14pt;">{title}</h1><table><thead><tr><th style="width: 22%;">Data</th><th style="width: 25%;">Bidone</th><th style="width: 53%;">Condomino</th></tr></thead><tbody>{rows_html}</tbody></table><p style="font-family: Arial; font-size: 7pt; color: #999; text-align: right; margin-top: 10px;">Aggiornato al: {data_gen}</p></body></html>"""
+        title_html = f'<h1 style="color: {config.COLOR_PRIMARY}; text-align: center; font-family: Arial; font-size: 14pt;">{title}</h1>' if title else ""
+        footer_html = f'<p style="font-family: Arial; font-size: 7pt; color: #999; text-align: right; margin-top: 10px;">Aggiornato al: {footer}</p>' if footer else ""
+        return f"""<html><head><meta charset="UTF-8"><style>@page {{ size: a4; margin: 1cm; }} table {{ border-collapse: collapse; width: 100%; }} th, td {{ border: 1px solid #dddddd; padding: 4px; text-align: center; vertical-align: middle; font-family: Arial, sans-serif; font-size: 10pt; line-height: 1.2; }} th {{ background-color: {config.COLOR_PRIMARY} !important; color: white !important; padding-top: 6px; padding-bottom: 6px; }}</style></head><body>{title_html}<table><thead><tr><th style="width: 22%;">Data</th><th style="width: 25%;">Bidone</th><th style="width: 53%;">Condomino</th></tr></thead><tbody>{rows_html}</tbody></table>{footer_html}</body></html>"""
+
+    def _plan_fragments(self, shifts: List[Shift], title: str) -> List[Tuple[str, Callable[[], str], int, int]]:
+        """Divide i turni (già ordinati) in pagine piene da `PDF_ROWS_PER_PAGE` righe: (hash del contenuto, builder dell'HTML, ordinale del primo e dell'ultimo giorno) per ognuna.
+
+        Le pagine prima di una modifica restano identiche, quindi una correzione o un nuovo ciclo in coda rigenerano solo le ultime.
+        """
+        size = config.PDF_ROWS_PER_PAGE
+        pages = [shifts[i:i + size] for i in range(0, len(shifts), size)]
+        plan = []
+        for i, rows in enumerate(pages):
+            page_title = title if i == 0 else None
+            # Sull'ultima pagina la data della lettura che l'ha prodotta: fuori dall'hash, altrimenti non si riuserebbe mai
+            footer = datetime.now().strftime("%d/%m/%Y %H:%M") if i == len(pages) - 1 else None
+            key = hashlib.sha256("\n".join([page_title or "", "footer" if footer else ""] +
+                                           ["|".join(s.to_row()) for s in rows]).encode()).hexdigest()
+            plan.append((key, lambda rows=rows, page_title=page_title, footer=footer:
+                         self._generate_html_template(rows, page_title, footer), rows[0].day, rows[-1].day))
+        return plan
+
+    def _render_fragments_sync(self, missing: List[Tuple[str, Callable[[], str]]]) -> Dict[str, bytes]:
+        rendered = {}
+        for key, build in missing:
+            pdf = self._convert_html_to_pdf(build())
+            if pdf is None:
+                raise RuntimeError("xhtml2pdf non ha prodotto la pagina")
+            rendered[key] = pdf
+        return rendered
+
+    def _merge_pdfs(self, fragments: List[bytes]) -> bytes:
+        writer = PdfWriter()
+        for fragment in fragments:
+            writer.append(PdfReader(BytesIO(fragment)))
+        buffer = BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    async def generate_pdf(self, sheet_url: str, worksheet_name: str = "Calendario", fresh: bool = False,
+                           start: Optional[date] = None, end: Optional[date] = None) -> Optional[Tuple[bytes, str]]:
+        """PDF del foglio (eventualmente limitato a [start, end]), assemblato da pagine in cache: si renderizzano solo quelle cambiate.
+
+        Con un intervallo si prendono le pagine del calendario completo che lo toccano, senza reimpaginare: la selezione è
+        per pagina, quindi la prima e l'ultima possono includere qualche turno fuori dall'intervallo.
 
-    async def generate_pdf(self, sheet_url: str, worksheet_name: str = "Calendario") -> Optional[bytes]:
+        Restituisce (pdf, digest): il digest dipende solo dai turni, quindi resta uguale anche dopo un riavvio
+        (i byte no: xhtml2pdf inserisce data e id del documento) ed è la chiave del media già caricato su WhatsApp.
+        """
         try:
-            records = await self.sheet.get_records(sheet_url, worksheet_name)
-            if len(records) < 1: return None
-            
-            title_text = "Calendario Turni"
-            html = self._generate_html_template(records, title=title_text)
-            
-            loop = asyncio.get_running_loop()
-            return await loop.run_in_executor(None, self._convert_html_to_pdf, html)
+            records = await self.sheet.get_records(sheet_url, worksheet_name, fresh=fresh)
+            # In ordine di data anche se il foglio non lo è: le pagine devono seguire il calendario
+            shifts = sorted(records.shifts, key=lambda s: s.day)
+            lo = start.toordinal() if start else 0
+            hi = end.toordinal() if end else date.max.toordinal()
+            plan = [(key, build) for key, build, first, last in self._plan_fragments(shifts, "Calendario Turni")
+                    if last >= lo and first <= hi]
+            if not plan: return None
+
+            digest = hashlib.sha256("".join(key for key, _ in plan).encode()).hexdigest()
+            cached = self._pdf_cache.get(digest)
+            if cached is not None:
+                self._pdf_cache.move_to_end(digest)
+                return cached, digest
+
+            missing = [(key, build) for key, build in plan if key not in self._fragments]
+            if missing:
+                self._fragments.update(await self._run_sync(self._render_fragments_sync, missing))
+            fragments = []
+            for key, _ in plan:
+                self._fragments.move_to_end(key)
+                fragments.append(self._fragments[key])
+            while len(self._fragments) > max(config.PDF_FRAGMENT_CACHE_SIZE, len(plan)):
+                self._fragments.popitem(last=False)
+
+            pdf = fragments[0] if len(fragments) == 1 else await self._run_sync(self._merge_pdfs, fragments)
+            self._pdf_cache[digest] = pdf
+            while len(self._pdf_cache) > config.PDF_DOCUMENT_CACHE_SIZE:
+                self._pdf_cache.popitem(last=False)
+            return pdf, digest
         except Exception as e:
             self.log.error(f"PDF Gen Error: {e}")
             return None
@@ -187,20 +966,17 @@ class CalendarService:
 
     # --- LIFECYCLE (Scheduler) ---
     async def manage_lifecycle(self, sheet_url: str) -> str:
-        loop = asyncio.get_running_loop()
         try:
-            records = await self.sheet.get_records(sheet_url)
+            tail = await self.sheet.get_tail(sheet_url)
             
-            if not records:
+            if not tail.has_rows:
                 self.log.info("⚠️ Calendario vuoto. Inizializzo.")
                 start_dt = self._get_first_monday_of_year(datetime.now().year)
                 await self.create_next_cycle_sheet(sheet_url, "Calendario", start_dt)
                 return "Inizializzato"
 
-            last_row = records[-1]
-            try:
-                last_dt = datetime.strptime(str(last_row['Data']), config.DATE_FORMAT).date()
-            except:
+            last_dt = tail.last_date
+            if last_dt is None:
                 return "Errore Data ultima riga"
 
             today = datetime.now().date()
@@ -208,18 +984,16 @@ class CalendarService:
 
             if days_left < 0:
                 self.log.info("🔴 Ciclo scaduto. Ruoto fogli.")
-                await loop.run_in_executor(None, self._rotate_sheets_sync, sheet_url, records)
+                await self._rotate_sheets(sheet_url, tail.first_date, last_dt.strftime(config.DATE_FORMAT))
+                self.sheet.invalidate(sheet_url)
                 return "Ruotato (Archiviato -> Promosso)"
 
             elif days_left <= 30:
-                exists = await loop.run_in_executor(None, self._check_sheet_exists_sync, sheet_url, "NuovoCalendario")
-                
-                if not exists:
+                if not tail.has_worksheet("NuovoCalendario"):
                     self.log.info(f"🟠 Scadenza vicina ({days_left}gg). Creo NuovoCalendario.")
                     
-                    condomini = await loop.run_in_executor(None, self._fetch_condomini_sync, sheet_url)
-                    last_name = str(last_row['Condomino'])
-                    next_idx = self._find_next_condomino_index(last_name, condomini)
+                    condomini = await self.sheet.get_residents(sheet_url)
+                    next_idx = self._find_next_condomino_index(tail.last_resident, condomini)
                     next_start = self._get_next_monday(last_dt)
                     
                     await self.create_next_cycle_sheet(sheet_url, "NuovoCalendario", next_start, next_idx)
@@ -229,38 +1003,44 @@ class CalendarService:
             
             return f"Attivo ({days_left}gg mancanti)"
 
+        except SheetUnavailableError as e:
+            self.log.warning(f"Lifecycle saltato, Google Sheets non raggiungibile: {e}")
+            return "Sheets non raggiungibile (Skip)"
         except Exception as e:
             self.log.exception(f"Errore Lifecycle: {e}")
             return "Errore"
 
     # --- MANUTENZIONE MANUALE (/genera) ---
     async def manual_fix_current_cycle(self, sheet_url: str) -> bool:
-        loop = asyncio.get_running_loop()
         try:
-            await loop.run_in_executor(None, self._truncate_future_sync, sheet_url)
-            condomini = await loop.run_in_executor(None, self._fetch_condomini_sync, sheet_url)
+            self.sheet.ensure_available(sheet_url)
+            # Condomini letti prima di troncare: se Sheets non risponde il calendario resta intatto
+            condomini = await self.sheet.get_residents(sheet_url)
+            await self._truncate_future(sheet_url)
             
             start_date = self._get_next_monday(datetime.now().date())
             next_idx = 0 
             
             turni = self._calculate_shifts_cycle(condomini, start_date, next_idx)
             
-            await loop.run_in_executor(None, self._append_shifts_sync, sheet_url, "Calendario", turni)
-            await loop.run_in_executor(None, self._format_sheet_sync, sheet_url, "Calendario")
+            await self._append_shifts(sheet_url, "Calendario", turni)
+            await self._format_sheet(sheet_url, "Calendario")
 
-            await loop.run_in_executor(None, self._delete_sheet_sync, sheet_url, "NuovoCalendario")
+            await self._delete_sheet(sheet_url, "NuovoCalendario")
             
             return True
         except Exception as e:
             self.log.error(f"Manual Fix Error: {e}")
             return False
+        finally:
+            self.sheet.invalidate(sheet_url)
 
     # --- MANUTENZIONE MANUALE (/genera nuovi) ---
     async def manual_regenerate_new_cycle(self, sheet_url: str) -> bool:
-        loop = asyncio.get_running_loop()
         try:
-            records = await self.sheet.get_records(sheet_url)
-            condomini = await loop.run_in_executor(None, self._fetch_condomini_sync, sheet_url)
+            self.sheet.ensure_available(sheet_url)
+            records = await self.sheet.get_records(sheet_url, fresh=True)
+            condomini = await self.sheet.get_residents(sheet_url)
 
             if not condomini:
                 self.log.error("Nessun condomino trovato in Impostazioni.")
@@ -269,14 +1049,11 @@ class CalendarService:
             start_date = self._get_next_monday(datetime.now().date())
             next_idx = 0
 
+            # Il ciclo riparte dopo l'ultima riga datata; la rotazione dall'ultimo condomino effettivo
+            if records.last_date:
+                start_date = self._get_next_monday(records.last_date)
             if records:
-                last_row = records[-1]
-                try:
-                    last_dt = datetime.strptime(str(last_row['Data']), config.DATE_FORMAT).date()
-                    start_date = self._get_next_monday(last_dt)
-                    next_idx = self._find_next_condomino_index(str(last_row['Condomino']), condomini)
-                except Exception as e:
-                    self.log.warning(f"Impossibile leggere ultima riga Calendario: {e}")
+                next_idx = self._find_next_condomino_index(records[-1].name, condomini)
 
             await self.create_next_cycle_sheet(sheet_url, "NuovoCalendario", start_date, next_idx)
             return True
@@ -285,14 +1062,14 @@ class CalendarService:
             return False
 
     async def create_next_cycle_sheet(self, sheet_url: str, target_sheet: str, start_date: date, start_idx: int = 0):
-        loop = asyncio.get_running_loop()
-        condomini = await loop.run_in_executor(None, self._fetch_condomini_sync, sheet_url)
+        condomini = await self.sheet.get_residents(sheet_url)
         if not condomini: return
 
         turni = self._calculate_shifts_cycle(condomini, start_date, start_idx)
         
-        await loop.run_in_executor(None, self._overwrite_sheet_sync, sheet_url, target_sheet, turni)
-        await loop.run_in_executor(None, self._format_sheet_sync, sheet_url, target_sheet)
+        await self._overwrite_sheet(sheet_url, target_sheet, turni)
+        self.sheet.invalidate(sheet_url)
+        await self._format_sheet(sheet_url, target_sheet)
 
     def _calculate_shifts_cycle(self, condomini: List[tuple], start_date: date, start_idx: int) -> List[List[str]]:
         turni = []
@@ -314,110 +1091,236 @@ class CalendarService:
         except StopIteration:
             return 0
 
-    # --- GSPREAD SYNC METHODS ---
-    def _fetch_condomini_sync(self, sheet_url: str) -> List[tuple]:
-        gc = self.sheet._get_client()
-        ws = gc.open_by_url(sheet_url).worksheet("Impostazioni")
-        raw = ws.get("A2:B1000")
-        return [(r[0], r[1] if len(r) > 1 else "") for r in raw if r and r[0].strip()]
+    # --- SCRITTURE SHEETS (client asyncio) ---
+    async def _worksheet_ids(self, sid: str) -> Dict[str, int]:
+        meta = await self.sheet.api.get_metadata(sid)
+        return {sh["properties"]["title"]: sh["properties"]["sheetId"] for sh in meta.get("sheets", [])}
 
-    def _rotate_sheets_sync(self, sheet_url: str, current_records: List[Dict]):
-        gc = self.sheet._get_client()
-        ss = gc.open_by_url(sheet_url)
+    async def _rotate_sheets(self, sheet_url: str, first_date: Optional[str], last_date: str):
+        sid = self.sheet._spreadsheet_id(sheet_url)
+        ids = await self._worksheet_ids(sid)
         try:
-            start = current_records[0]['Data'].replace('/', '-')
-            end = current_records[-1]['Data'].replace('/', '-')
+            start = first_date.replace('/', '-')
+            end = last_date.replace('/', '-')
             archive_name = f"Archivio_{start}_{end}"
         except:
             archive_name = f"Archivio_{datetime.now().strftime('%Y%m%d')}"
 
-        try:
-            ws_cal = ss.worksheet("Calendario")
-            ws_cal.update_title(archive_name)
-        except: pass
-
-        try:
-            ws_new = ss.worksheet("NuovoCalendario")
-            ws_new.update_title("Calendario")
-        except gspread.WorksheetNotFound:
-            ss.add_worksheet("Calendario", 1000, 4)
+        # Archiviazione e promozione in un'unica batchUpdate: Sheets le applica insieme o nessuna
+        reqs = []
+        if "Calendario" in ids:
+            reqs.append({"updateSheetProperties": {"properties": {"sheetId": ids["Calendario"], "title": archive_name}, "fields": "title"}})
+        if "NuovoCalendario" in ids:
+            reqs.append({"updateSheetProperties": {"properties": {"sheetId": ids["NuovoCalendario"], "title": "Calendario"}, "fields": "title"}})
+        else:
+            reqs.append({"addSheet": {"properties": {"title": "Calendario", "gridProperties": {"rowCount": 1000, "columnCount": 4}}}})
+        await self.sheet.api.batch_update(sid, reqs)
 
-    def _truncate_future_sync(self, sheet_url: str) -> Optional[Dict]:
-        gc = self.sheet._get_client()
-        ws = gc.open_by_url(sheet_url).worksheet("Calendario")
-        all_values = ws.get_all_records()
+    async def _truncate_future(self, sheet_url: str) -> Optional[List[str]]:
+        sid = self.sheet._spreadsheet_id(sheet_url)
         today = datetime.now().date()
-        keep = []
-        for row in all_values:
+        # Filtro sulla sola data, sui valori grezzi: le righe passate senza condomino (festivi, ritiri saltati) restano
+        rows = []
+        for row in (await self.sheet.api.values_get(sid, "'Calendario'"))[1:]:
             try:
-                if datetime.strptime(str(row['Data']), config.DATE_FORMAT).date() <= today:
-                    keep.append(row)
-            except: pass
-        ws.clear()
-        ws.append_row(["Data", "Bidone", "Condomino", "Telefono"])
-        rows = [[r['Data'], r['Bidone'], r['Condomino'], r['Telefono']] for r in keep]
+                if datetime.strptime(row[0].strip(), config.DATE_FORMAT).date() <= today:
+                    rows.append((row + [""] * 4)[:4])
+            except (ValueError, IndexError):
+                pass
+        await self.sheet.api.values_clear(sid, "'Calendario'")
+        await self.sheet.api.values_update(sid, "'Calendario'!A1:D1", [list(ShiftCalendar.HEADER)])
         if rows:
-            ws.append_rows(rows)
-            return keep[-1]
+            await self.sheet.api.values_append(sid, "'Calendario'!A1", rows)
+            return rows[-1]
         return None
 
-    def _overwrite_sheet_sync(self, sheet_url: str, title: str, rows: List[List[str]]):
-        gc = self.sheet._get_client()
-        ss = gc.open_by_url(sheet_url)
-        try:
-            ws = ss.worksheet(title)
-            ws.clear()
-        except:
-            ws = ss.add_worksheet(title, 1000, 4)
-        ws.update(values=[["Data", "Bidone", "Condomino", "Telefono"]], range_name="A1:D1")
-        if rows: ws.append_rows(rows)
-
-    def _append_shifts_sync(self, sheet_url: str, title: str, rows: List[List[str]]):
-        gc = self.sheet._get_client()
-        ws = gc.open_by_url(sheet_url).worksheet(title)
-        ws.append_rows(rows)
-
-    def _format_sheet_sync(self, sheet_url: str, title: str):
-        gc = self.sheet._get_client()
-        ss = gc.open_by_url(sheet_url)
-        ws = ss.worksheet(title)
-        sid = ws._properties['sheetId']
-        reqs = [
-            {"updateCells": {"range": {"sheetId": sid, "startRowIndex": 0, "endColumnIndex": 4}, "fields": "userEnteredFormat(textFormat,horizontalAlignment,verticalAlignment)", "rows": [{"values": [{"userEnteredFormat": {"horizontalAlignment": "CENTER", "verticalAlignment": "MIDDLE", "textFormat": {"fontFamily": "Arial", "fontSize": 11}}} for _ in range(4)]} for _ in range(len(ws.get_all_values()))]}},
-            {"autoResizeDimensions": {"dimensions": {"sheetId": sid, "dimension": "COLUMNS", "startIndex": 0, "endIndex": 4}}},
-            {"updateSheetProperties": {"properties": {"sheetId": sid, "gridProperties": {"frozenRowCount": 1}}, "fields": "gridProperties.frozenRowCount"}},
-            {"addBanding": {"bandedRange": {"range": {"sheetId": sid, "startRowIndex": 1, "endColumnIndex": 4}, "rowProperties": {"firstBandColor": {"red": 1, "green": 1, "blue": 1}, "secondBandColor": {"red": 0.95, "green": 0.95, "blue": 0.95}}}}}
-        ]
+    async def _overwrite_sheet(self, sheet_url: str, title: str, rows: List[List[str]]):
+        sid = self.sheet._spreadsheet_id(sheet_url)
+        if title in await self._worksheet_ids(sid):
+            await self.sheet.api.values_clear(sid, f"'{title}'")
+        else:
+            await self.sheet.api.batch_update(sid, [{"addSheet": {"properties": {"title": title, "gridProperties": {"rowCount": 1000, "columnCount": 4}}}}])
+        await self.sheet.api.values_update(sid, f"'{title}'!A1:D1", [list(ShiftCalendar.HEADER)])
+        if rows:
+            await self.sheet.api.values_append(sid, f"'{title}'!A1", rows)
+
+    async def _append_shifts(self, sheet_url: str, title: str, rows: List[List[str]]):
+        sid = self.sheet._spreadsheet_id(sheet_url)
+        await self.sheet.api.values_append(sid, f"'{title}'!A1", rows)
+
+    async def _format_sheet(self, sheet_url: str, title: str):
+        sid = self.sheet._spreadsheet_id(sheet_url)
         try:
-            ss.batch_update({"requests": reqs})
+            ws_id = (await self._worksheet_ids(sid))[title]
+            n_rows = len(await self.sheet.api.values_get(sid, f"'{title}'!A:A"))
+            reqs = [
+                {"updateCells": {"range": {"sheetId": ws_id, "startRowIndex": 0, "endColumnIndex": 4}, "fields": "userEnteredFormat(textFormat,horizontalAlignment,verticalAlignment)", "rows": [{"values": [{"userEnteredFormat": {"horizontalAlignment": "CENTER", "verticalAlignment": "MIDDLE", "textFormat": {"fontFamily": "Arial", "fontSize": 11}}} for _ in range(4)]} for _ in range(n_rows)]}},
+                {"autoResizeDimensions": {"dimensions": {"sheetId": ws_id, "dimension": "COLUMNS", "startIndex": 0, "endIndex": 4}}},
+                {"updateSheetProperties": {"properties": {"sheetId": ws_id, "gridProperties": {"frozenRowCount": 1}}, "fields": "gridProperties.frozenRowCount"}},
+                {"addBanding": {"bandedRange": {"range": {"sheetId": ws_id, "startRowIndex": 1, "endColumnIndex": 4}, "rowProperties": {"firstBandColor": {"red": 1, "green": 1, "blue": 1}, "secondBandColor": {"red": 0.95, "green": 0.95, "blue": 0.95}}}}}
+            ]
+            await self.sheet.api.batch_update(sid, reqs)
         except Exception: pass 
 
-    def _check_sheet_exists_sync(self, sheet_url: str, title: str) -> bool:
-        gc = self.sheet._get_client()
-        ss = gc.open_by_url(sheet_url)
+    async def _delete_sheet(self, sheet_url: str, title: str):
+        sid = self.sheet._spreadsheet_id(sheet_url)
         try:
-            ss.worksheet(title)
-            return True
-        except: return False
+            ids = await self._worksheet_ids(sid)
+            if title in ids:
+                await self.sheet.api.batch_update(sid, [{"deleteSheet": {"sheetId": ids[title]}}])
+        except: pass
 
-    def _delete_sheet_sync(self, sheet_url: str, title: str):
-        gc = self.sheet._get_client()
-        ss = gc.open_by_url(sheet_url)
+# --- SHARDING ---
+def shard_for(jid: str, workers: int) -> int:
+    """Shard stabile tra riavvii (a differenza di hash())."""
+    return zlib.crc32(jid.encode()) % workers
+
+class GroupJobs:
+    """Lavoro pesante per gruppo (lifecycle, reminder, PDF): eseguito qui o inoltrato al worker del gruppo tramite la coda SQLite."""
+
+    def __init__(self, repo: ConfigRepository, calendar_service: CalendarService, workers: int):
+        self.repo = repo
+        self.calendar = calendar_service
+        self.workers = workers
+        self.log = logging.getLogger("GroupJobs")
+
+    async def execute(self, kind: str, payload: Dict[str, Any]) -> Any:
+        if kind == "lifecycle":
+            return await self.calendar.manage_lifecycle(payload["url"])
+        if kind == "reminders":
+            # Sempre da Sheets: la cache può avere fino a un'ora e perdere le modifiche manuali del mattino
+            try:
+                records = await self.calendar.sheet.get_records(payload["url"], fresh=True)
+            except SheetUnavailableError:
+                records = self.calendar.sheet.cached_records(payload["url"])
+                if records is None: raise
+                self.log.warning(f"⚠️ Reminder per {payload.get('jid', '?')} da dati non aggiornati (ultima lettura {records.stale_since:%d/%m/%Y %H:%M})")
+            return [[s.phone, s.bin] for s in records.on(date.fromordinal(payload["day"]))]
+        if kind == "pdf":
+            start, end = (date.fromordinal(payload[k]) if payload.get(k) else None for k in ("start", "end"))
+            return await self.calendar.generate_pdf(payload["url"], payload["worksheet"], fresh=payload.get("fresh", False), start=start, end=end)
+        raise ValueError(f"Job sconosciuto: {kind}")
+
+    @staticmethod
+    def encode(kind: str, value: Any) -> Optional[bytes]:
+        # PDF: digest esadecimale (64 caratteri) seguito dai byte del documento
+        if kind == "pdf": return value[1].encode() + value[0] if value else None
+        return json.dumps(value).encode()
+
+    @staticmethod
+    def decode(kind: str, blob: Optional[bytes]) -> Any:
+        if blob is None: return None
+        if kind == "pdf": return blob[64:], blob[:64].decode()
+        return json.loads(blob)
+
+    async def run(self, jid: str, kind: str, **payload) -> Any:
+        if self.workers <= 0:
+            return await self.execute(kind, payload)
+
+        shard = shard_for(jid, self.workers)
+        job_id = await db_call(self.repo.enqueue_job, shard, kind, json.dumps({"jid": jid, **payload}))
+        deadline = time.monotonic() + config.JOB_TIMEOUT_SECONDS
+        warned = False
+        with tracer.span("job.remote", kind=kind, shard=shard):
+            while True:
+                row = await db_call(self.repo.get_job, job_id)
+                if row is None:
+                    raise RuntimeError(f"Job {job_id} rimosso dalla coda")
+                status, result, error = row
+                if status in ("done", "error"):
+                    await db_call(self.repo.delete_job, job_id)
+                    if error:
+                        raise RuntimeError(f"Worker {shard}: {error}")
+                    value = self.decode(kind, result)
+                    break
+                if time.monotonic() > deadline:
+                    # Si rinuncia solo se nessun worker l'ha preso; uno già avviato si attende fino all'esito,
+                    # così lo slot del gruppo resta occupato e un /genera non si sovrappone alla rotazione
+                    if await db_call(self.repo.cancel_job, job_id):
+                        raise asyncio.TimeoutError(f"Job {kind} non preso in carico dal worker {shard}")
+                    if not warned:
+                        self.log.warning(f"⏳ Job {kind} ({jid}) ancora in corso sul worker {shard}")
+                        warned = True
+                await asyncio.sleep(config.JOB_POLL_SECONDS)
+
+        # Il worker può aver scritto sullo spreadsheet: la cache di questo processo non è più affidabile
+        if kind == "lifecycle":
+            self.calendar.sheet.invalidate(payload["url"])
+        return value
+
+async def run_worker(index: int, workers: int):
+    """Processo worker: esegue i job dello shard `index`, senza connessione WhatsApp."""
+    log = logging.getLogger(f"Worker{index}")
+    # SIGTERM dal processo principale: uscita pulita, con rilascio del lease dello shard
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    repo = ConfigRepository(config.DB_PATH_CONFIG)
+    sheet_service = SheetService(config.CREDENTIALS_FILE)
+    jobs = GroupJobs(repo, CalendarService(sheet_service), workers=0)
+
+    # Un solo processo per shard, anche con worker orfani o istanze duplicate
+    lease = Lease(repo, f"worker:{index}", f"{socket.gethostname()}:{os.getpid()}", config.LEASE_TTL_SECONDS)
+    if not await lease.renew():
+        log.info(f"⏳ Shard {index} occupato da un altro worker, attendo la scadenza del lease")
+        while not await lease.renew():
+            await asyncio.sleep(config.LEASE_TTL_SECONDS / 6)
+
+    def on_lost():
+        # Un altro processo può aver preso lo shard: uscire subito (thread di rendering inclusi) è l'unico modo per non eseguire due volte lo stesso job
+        log.error(f"❌ Lease dello shard {index} perso, termino")
+        os._exit(1)
+
+    heartbeat = asyncio.create_task(lease.keep_alive(on_lost))
+    requeued = await db_call(repo.requeue_running_jobs, index)
+    log.info(f"🧵 Worker {index}/{workers} avviato" + (f" ({requeued} job ripresi)" if requeued else ""))
+
+    semaphore = asyncio.Semaphore(config.MAX_PARALLEL_GROUPS)
+    tasks: set = set()
+
+    async def process(job_id: int, kind: str, payload: Dict[str, Any]):
         try:
-            ws = ss.worksheet(title)
-            ss.del_worksheet(ws)
-        except: pass
+            with tracer.trace(f"job:{kind}", chat=payload.get("jid")):
+                value = await jobs.execute(kind, payload)
+            await db_call(repo.finish_job, job_id, GroupJobs.encode(kind, value))
+        except Exception as e:
+            log.exception(f"❌ Job {job_id} ({kind}) fallito: {e}")
+            await db_call(repo.finish_job, job_id, None, str(e) or type(e).__name__)
+        finally:
+            semaphore.release()
+
+    try:
+        while True:
+            await semaphore.acquire()
+            job = await db_call(repo.claim_job, index)
+            if not job:
+                semaphore.release()
+                await asyncio.sleep(config.JOB_POLL_SECONDS)
+                continue
+            job_id, kind, payload = job
+            task = asyncio.create_task(process(job_id, kind, json.loads(payload)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        heartbeat.cancel()
+        lease.release()
+        await sheet_service.close()
 
-# --- MAIN BOT CLASS ---
 # --- MAIN BOT CLASS ---
 class GarbageBot:
-    def __init__(self):
+    def __init__(self, client: Optional[NewAClient] = None, repo: Optional[ConfigRepository] = None,
+                 sheet_service: Optional[SheetService] = None, calendar_service: Optional[CalendarService] = None):
+        # Le dipendenze si possono iniettare (es. backend finti in loadtest.py)
         self.log = logging.getLogger("GarbageBot")
-        self.client = NewAClient(config.DB_PATH_NEONIZE)
-        self.repo = ConfigRepository(config.DB_PATH_CONFIG)
-        self.sheet_service = SheetService(config.CREDENTIALS_FILE)
-        self.calendar_service = CalendarService(self.sheet_service)
+        self.client = client or NewAClient(config.DB_PATH_NEONIZE)
+        self.repo = repo or ConfigRepository(config.DB_PATH_CONFIG)
+        self.sheet_service = sheet_service or SheetService(config.CREDENTIALS_FILE)
+        self.calendar_service = calendar_service or CalendarService(self.sheet_service)
+        self.dispatcher = CommandDispatcher(config.MAX_PARALLEL_GROUPS)
+        self.group_jobs = GroupJobs(self.repo, self.calendar_service, config.WORKERS)
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.scheduler_lease = Lease(self.repo, "scheduler", self.instance_id, config.LEASE_TTL_SECONDS)
+        self._worker_procs: Dict[int, asyncio.subprocess.Process] = {}
         self.me: Optional[JID] = None
+        self._warm_up_task: Optional[asyncio.Task] = None
         self.command_handlers: Dict[str, Callable] = {
             '/oggi': self.cmd_oggi,
             '/prossimi': self.cmd_prossimi,
@@ -433,6 +1336,7 @@ class GarbageBot:
             '/config_check': self.cmd_admin_check,
             '/config_reset': self.cmd_admin_reset,
             '/db_reset': self.cmd_admin_db_reset,
+            '/trace_lenti': self.cmd_admin_slow_traces,
         }
         self._register_events()
 
@@ -446,34 +1350,84 @@ class GarbageBot:
         if hasattr(me_obj, 'JID'):
             self.me = me_obj.JID
             self.log.info(f"👤 Bot JID: {self.me.User}")
+        self._start_warm_up()
 
-    async def on_message(self, client: NewAClient, message: MessageEv):
+    async def on_message(self, client: NewAClient, message: MessageEv) -> Optional[asyncio.Future]:
         try:
             txt = (message.Message.conversation or message.Message.extendedTextMessage.text or "").strip()
-            if not txt.startswith("/"): return
+            if not txt.startswith("/"): return None
             args = txt.split()
             cmd = args[0].lower()
             handler = self.command_handlers.get(cmd)
             if handler:
                 self.log.info(f"📨 Executing {cmd}")
-                await handler(message, args[1:])
+                chat_jid = message.Info.MessageSource.Chat.User
+                return self.dispatcher.submit(
+                    chat_jid,
+                    lambda: self._run_traced(cmd, lambda: handler(message, args[1:]), chat=chat_jid),
+                    fast=cmd in config.FAST_LANE_COMMANDS
+                )
         except Exception as e:
             self.log.exception(f"❌ CRITICAL ERROR in on_message: {e}")
+        return None
+
+    async def _run_traced(self, name: str, job: Callable[[], Awaitable[Any]], **attrs):
+        with tracer.trace(name, **attrs):
+            return await job()
 
     async def _reply(self, text: str, msg: MessageEv):
         try:
-            await self.client.reply_message(text, msg)
+            with tracer.span("wa.reply"):
+                await self.client.reply_message(text, msg)
         except Exception as e:
             self.log.error(f"Reply error: {e}")
 
+    async def _render_pdf(self, jid: str, url: str, worksheet_name: str = "Calendario", fresh: bool = False,
+                          start: Optional[date] = None, end: Optional[date] = None) -> Optional[Tuple[bytes, str]]:
+        try:
+            return await self.group_jobs.run(jid, "pdf", url=url, worksheet=worksheet_name, fresh=fresh,
+                                             start=start.toordinal() if start else None, end=end.toordinal() if end else None)
+        except Exception as e:
+            self.log.error(f"PDF Gen Error ({jid}): {e}")
+            return None
+
+    async def _send_document(self, jid: JID, doc: bytes, filename: str, caption: str, media_key: Optional[str] = None):
+        """Invia un PDF riusando, se ancora valido, il media già caricato per lo stesso contenuto.
+
+        `media_key` è il digest dei turni restituito da `generate_pdf`; senza, si usa l'hash dei byte.
+        """
+        key = f"pdf:{media_key}" if media_key else hashlib.sha256(doc).hexdigest()
+        max_age = config.MEDIA_CACHE_TTL_DAYS * 86400
+        cached = await db_call(self.repo.get_media, key, max_age)
+        if cached:
+            msg = WAMessage()
+            msg.ParseFromString(cached)
+            msg.documentMessage.caption = caption or ""
+            msg.documentMessage.fileName = filename
+            if msg.documentMessage.title:
+                msg.documentMessage.title = filename
+            try:
+                with tracer.span("wa.send", cached=True):
+                    await self.client.send_message(jid, message=msg)
+                return
+            except Exception as e:
+                self.log.warning(f"Invio media in cache fallito, nuovo upload: {e}")
+                await db_call(self.repo.delete_media, key)
+
+        with tracer.span("wa.upload", size=len(doc)):
+            msg = await self.client.build_document_message(doc, filename, caption, "application/pdf")
+        await db_call(self.repo.put_media, key, msg.SerializeToString(), max_age)
+        with tracer.span("wa.send"):
+            await self.client.send_message(jid, message=msg)
+
     async def _send_private(self, jid: JID, text: str = None, doc: bytes = None, filename: str = None):
         clean_jid = JID(User=jid.User, Server=jid.Server, Device=0, Integrator=0, RawAgent=0)
         try:
             if doc:
-                msg = await self.client.build_document_message(doc, filename, text, "application/pdf")
-                await self.client.send_message(clean_jid, message=msg)
+                await self._send_document(clean_jid, doc, filename, text)
             else:
-                await self.client.send_message(clean_jid, text)
+                with tracer.span("wa.send"):
+                    await self.client.send_message(clean_jid, text)
         except Exception as e:
             self.log.error(f"Send error: {e}")
 
@@ -512,6 +1466,13 @@ class GarbageBot:
             return None
         return url
 
+    async def _get_records_or_reply(self, url: str, msg: MessageEv) -> Optional[ShiftCalendar]:
+        try:
+            return await self.sheet_service.get_records(url)
+        except SheetUnavailableError:
+            await self._reply("⚠️ Google Sheets non è raggiungibile al momento. Riprova tra qualche minuto.", msg)
+            return None
+
     async def _check_genera_permission(self, msg: MessageEv) -> bool:
         sender_phone = msg.Info.MessageSource.Sender.User
         group_jid = msg.Info.MessageSource.Chat
@@ -534,6 +1495,7 @@ class GarbageBot:
             "🔜 */prossimi*\n_Visualizza i prossimi 10 turni_\n\n"
             "📜 */regole*\n_Leggi il regolamento rifiuti_\n\n"
             "📥 */calendario*\n_Scarica il PDF aggiornato_\n\n"
+            "🗓️ */calendario futuri* · */calendario da* `gg/mm/aaaa` *a* `gg/mm/aaaa`\n_Scarica il PDF dei soli turni futuri o di un periodo_\n\n"
             "🔧 */genera*\n_Corregge il futuro dell'attuale ciclo dei turni (solo per amministratori del gruppo)_\n\n"
             "🆕 */genera nuovi*\n_Crea una nuova turnazione partendo dalla fine del ciclo attuale (solo per amministratori del gruppo)_\n\n"
             "ℹ️ */info*\n_Mostra questo messaggio_"
@@ -549,35 +1511,34 @@ class GarbageBot:
                 "\n\n🔗 */config* `<link_gruppo>` `<link_sheet>`\n_Configura il bot via link (da usare in chat privata col bot)_\n\n"
                 "📋 */config_check*\n_Lista delle configurazioni attive_\n\n"
                 "🗑️ */config_reset* `numero`\n_Rimuove una configurazione specifica_\n\n"
-                "☢️ */db_reset*\n_Pulisce e ricrea il database_"
+                "☢️ */db_reset*\n_Pulisce e ricrea il database_\n\n"
+                "🐢 */trace_lenti* `[n]`\n_Mostra gli ultimi n comandi lenti con il dettaglio delle operazioni_"
             )
         return base
 
     async def cmd_oggi(self, msg: MessageEv, _):
         url = await self._get_sheet_context(msg)
         if not url: return
-        oggi = datetime.now().strftime(config.DATE_FORMAT)
-        records = await self.sheet_service.get_records(url)
-        found = next((r for r in records if str(r['Data']) == oggi), None)
-        if found: await self._reply(f"📅 *Oggi ({oggi})*\n👤 {found['Condomino']}\n🗑️ {found.get('Bidone','')}", msg)
-        else: await self._reply("ℹ️ Nessun turno oggi.", msg)
+        oggi = datetime.now().date()
+        records = await self._get_records_or_reply(url, msg)
+        if records is None: return
+        stale = self.sheet_service.stale_note(records.stale_since)
+        found = next(iter(records.on(oggi)), None)
+        if found: await self._reply(f"📅 *Oggi ({found.date_str})*\n👤 {found.name}\n🗑️ {found.bin}{stale}", msg)
+        else: await self._reply(f"ℹ️ Nessun turno oggi.{stale}", msg)
 
     async def cmd_prossimi(self, msg: MessageEv, _):
         url = await self._get_sheet_context(msg)
         if not url: return
-        records = await self.sheet_service.get_records(url)
-        oggi = datetime.now().date()
-        futuri = []
-        for r in records:
-            try:
-                if datetime.strptime(str(r['Data']), config.DATE_FORMAT).date() >= oggi:
-                    futuri.append(r)
-            except: continue
+        records = await self._get_records_or_reply(url, msg)
+        if records is None: return
+        stale = self.sheet_service.stale_note(records.stale_since)
+        futuri = records.since(datetime.now().date())
         if not futuri:
-            await self._reply("ℹ️ Fine calendario.", msg)
+            await self._reply(f"ℹ️ Fine calendario.{stale}", msg)
             return
-        txt = "📅 *Prossimi Turni:*\n" + "\n".join([f"- {r['Data'][:5]}: *{r['Condomino']}* ({r['Bidone']})" for r in futuri[:10]])
-        await self._reply(txt, msg)
+        txt = "📅 *Prossimi Turni:*\n" + "\n".join([f"- {s.date_str[:5]}: *{s.name}* ({s.bin})" for s in futuri[:10]])
+        await self._reply(txt + stale, msg)
 
     async def cmd_regole(self, msg: MessageEv, _):
         url = await self._get_sheet_context(msg)
@@ -586,7 +1547,7 @@ class GarbageBot:
         await self._reply(f"📋 *Regolamento*\n\n{regole}", msg)
 
     async def cmd_calendario(self, msg: MessageEv, args: List[str]):
-        """Gestisce /calendario [pdf|scarica|download]."""
+        """Gestisce /calendario [pdf|scarica|download], /calendario futuri e /calendario da <data> [a <data>]."""
         if not msg.Info.MessageSource.IsGroup:
             await self._reply("❌ Comando disponibile solo nei gruppi.", msg)
             return
@@ -603,16 +1564,39 @@ class GarbageBot:
             )
             return
 
-        if action in ["pdf", "scarica", "download"]:
-            await self._reply("⏳ Generazione PDF...", msg)
-            pdf = await self.calendar_service.generate_pdf(url)
-            if pdf:
-                doc_msg = await self.client.build_document_message(pdf, "CalendarioTurni.pdf", "📅 *Calendario Turni*", "application/pdf")
-                await self.client.send_message(msg.Info.MessageSource.Chat, message=doc_msg)
-            else:
-                await self._reply("❌ Impossibile generare il PDF.", msg)
-        else:
+        start = end = None
+        if action in ["futuri", "futuro", "prossimi"]:
+            start = datetime.now().date()
+        elif action in ["da", "dal"]:
+            try:
+                start, end = self._parse_date_range(args[1:])
+            except ValueError:
+                await self._reply("❓ Formato non valido. Usa `/calendario da gg/mm/aaaa a gg/mm/aaaa`.", msg)
+                return
+        elif action not in ["pdf", "scarica", "download"]:
             await self._reply("❓ Sotto-comando non riconosciuto. Usa `/calendario` per il PDF.", msg)
+            return
+
+        await self._reply("⏳ Generazione PDF...", msg)
+        rendered = await self._render_pdf(msg.Info.MessageSource.Chat.User, url, start=start, end=end)
+        if rendered:
+            pdf, digest = rendered
+            await self._send_document(msg.Info.MessageSource.Chat, pdf, "CalendarioTurni.pdf", "📅 *Calendario Turni*", media_key=digest)
+        elif start or end:
+            await self._reply("📭 Nessun turno nel periodo richiesto.", msg)
+        else:
+            await self._reply("❌ Impossibile generare il PDF.", msg)
+
+    @staticmethod
+    def _parse_date_range(args: List[str]) -> Tuple[date, Optional[date]]:
+        """`<data> [a <data>]` -> (inizio, fine); ValueError se il formato non è valido."""
+        if len(args) not in (1, 3) or (len(args) == 3 and args[1].lower() not in ("a", "al")):
+            raise ValueError(args)
+        start = datetime.strptime(args[0], config.DATE_FORMAT).date()
+        end = datetime.strptime(args[2], config.DATE_FORMAT).date() if len(args) == 3 else None
+        if end and end < start:
+            raise ValueError(args)
+        return start, end
 
     async def cmd_genera(self, msg: MessageEv, args: List[str]):
         """
@@ -628,6 +1612,12 @@ class GarbageBot:
         if not await self._check_genera_permission(msg):
             return
 
+        try:
+            self.sheet_service.ensure_available(url)
+        except SheetUnavailableError:
+            await self._reply("⚠️ Google Sheets non è raggiungibile al momento: calendario non modificato. Riprova tra qualche minuto.", msg)
+            return
+
         sub = args[0].lower() if args else ""
         group_jid = msg.Info.MessageSource.Chat
 
@@ -638,28 +1628,20 @@ class GarbageBot:
                 msg
             )
             try:
-                success = await asyncio.wait_for(
-                    self.calendar_service.manual_regenerate_new_cycle(url),
-                    timeout=60.0
-                )
+                success = await self._await_sheet_write(self.calendar_service.manual_regenerate_new_cycle(url), msg, "/genera nuovi")
                 if success:
-                    pdf = await self.calendar_service.generate_pdf(url, worksheet_name="NuovoCalendario")
-                    if pdf:
+                    rendered = await self._render_pdf(group_jid.User, url, worksheet_name="NuovoCalendario", fresh=True)
+                    if rendered:
+                        pdf, digest = rendered
                         caption = (
                             "✅ *Nuovo ciclo generato*\n"
                             "Il nuovo ciclo è stato creato correttamente in base all'attuale fine ciclo."
                         )
-                        doc_msg = await self.client.build_document_message(
-                            pdf, "NuovoCalendario.pdf", caption, "application/pdf"
-                        )
-                        await self.client.send_message(group_jid, message=doc_msg)
+                        await self._send_document(group_jid, pdf, "NuovoCalendario.pdf", caption, media_key=digest)
                     else:
                         await self._reply("✅ Nuovo ciclo generato, ma si è verificato un errore nella creazione del PDF.", msg)
                 else:
                     await self._reply("❌ Errore durante la creazione del nuovo ciclo.", msg)
-            except asyncio.TimeoutError:
-                self.log.error("❌ TIMEOUT Google Sheets (/genera nuovi)")
-                await self._reply("❌ Errore di timeout durante la connessione a Google Sheets.", msg)
             except Exception as e:
                 self.log.exception(f"❌ ECCEZIONE /genera nuovi: {e}")
                 await self._reply(f"❌ Errore critico: {str(e)}", msg)
@@ -671,33 +1653,36 @@ class GarbageBot:
                 msg
             )
             try:
-                success = await asyncio.wait_for(
-                    self.calendar_service.manual_fix_current_cycle(url),
-                    timeout=60.0
-                )
+                success = await self._await_sheet_write(self.calendar_service.manual_fix_current_cycle(url), msg, "/genera")
                 if success:
-                    pdf = await self.calendar_service.generate_pdf(url, worksheet_name="Calendario")
-                    if pdf:
+                    rendered = await self._render_pdf(group_jid.User, url, worksheet_name="Calendario", fresh=True)
+                    if rendered:
+                        pdf, digest = rendered
                         caption = (
                             "✅ *Calendario Aggiornato e Resettato*\n\n"
                             "I turni futuri sono stati eliminati e la lista è ripartita dal primo condomino a partire dal prossimo lunedì.\n\n"
                             "_Se era presente una bozza in NuovoCalendario, è stata eliminata._"
                         )
-                        doc_msg = await self.client.build_document_message(
-                            pdf, "CalendarioTurni.pdf", caption, "application/pdf"
-                        )
-                        await self.client.send_message(group_jid, message=doc_msg)
+                        await self._send_document(group_jid, pdf, "CalendarioTurni.pdf", caption, media_key=digest)
                     else:
                         await self._reply("⚠️ Ciclo riavviato ma errore nella generazione del PDF.", msg)
                 else:
                     await self._reply("❌ Errore durante il riavvio del ciclo corrente.", msg)
-            except asyncio.TimeoutError:
-                self.log.error("❌ TIMEOUT Google Sheets (/genera)")
-                await self._reply("❌ Errore di timeout durante la connessione a Google Sheets.", msg)
             except Exception as e:
                 self.log.exception(f"❌ ECCEZIONE /genera: {e}")
                 await self._reply(f"❌ Errore critico: {str(e)}", msg)
 
+    async def _await_sheet_write(self, coro: Awaitable[bool], msg: MessageEv, label: str) -> bool:
+        """Attende una scrittura sul foglio senza mai interromperla: annullata a metà lascerebbe il calendario svuotato e non riscritto,
+        quindi oltre i 60s si avvisa il gruppo ma lo slot della coda resta occupato fino alla fine vera."""
+        task = asyncio.ensure_future(coro)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=60.0)
+        except asyncio.TimeoutError:
+            self.log.warning(f"⏳ Google Sheets lento ({label}): attendo la fine della scrittura")
+            await self._reply("⏳ Google Sheets sta rispondendo lentamente: l'operazione è ancora in corso, riceverai l'esito al termine.", msg)
+            return await task
+
     async def cmd_help(self, msg: MessageEv, _):
         chat_jid = msg.Info.MessageSource.Chat
         sender = msg.Info.MessageSource.Sender.User
@@ -848,20 +1833,52 @@ class GarbageBot:
         self.repo.recreate_tables()
         await self._reply("☢️ DB Resettato e Schema aggiornato.", msg)
 
+    async def cmd_admin_slow_traces(self, msg: MessageEv, args: List[str]):
+        # Ignora se usato in un gruppo
+        if msg.Info.MessageSource.IsGroup: return
+        if not self._is_admin(msg): return
+
+        try:
+            n = max(1, int(args[0])) if args else 5
+        except ValueError:
+            n = 5
+        traces = tracer.recent_slow(n)
+        if not traces:
+            await self._reply(f"✅ Nessuna operazione sopra {config.SLOW_OP_THRESHOLD_MS} ms.", msg)
+            return
+
+        txt = ""
+        for t in reversed(traces):
+            root = t["root"]
+            chat = root.get("chat", "-")
+            txt += f"🐢 *{t['name']}* ({root['ms']:.0f} ms) - {t['started']}\n   🆔 {t['trace_id']} · 👥 {chat}\n"
+            for sp in sorted((sp for sp in t["spans"] if sp is not root), key=lambda sp: sp["ms"], reverse=True)[:5]:
+                err = f" ❌ {sp['error']}" if "error" in sp else ""
+                txt += f"   • {sp['span']}: {sp['ms']:.0f} ms{err}\n"
+            txt += "\n"
+        await self._reply(f"📋 Ultimi comandi lenti:\n\n{txt}", msg)
+
     async def scheduler_loop(self):
         self.log.info("⏰ Scheduler Avviato")
-        
-        self.log.info("🔍 Controllo stato iniziale...")
-        await self._check_calendar_health()
+        initial_check_done = False
 
         while True:
             try:
+                # Solo l'istanza che detiene il lease (rinnovato da `keep_alive`) esegue i job; ricontrollato prima di ognuno
+                if not self.scheduler_lease.held:
+                    await asyncio.sleep(5)
+                    continue
+                if not initial_check_done and await self.scheduler_lease.renew():
+                    self.log.info("🔍 Controllo stato iniziale...")
+                    await self._check_calendar_health()
+                    initial_check_done = True
+
                 now = datetime.now()
-                if now.strftime("%H:%M") == "09:00":
-                    await self._send_reminders(now.strftime(config.DATE_FORMAT))
+                if now.strftime("%H:%M") == "09:00" and await self.scheduler_lease.renew():
+                    await self._send_reminders(now.date())
                     await asyncio.sleep(61)
                 
-                if now.minute == 0:
+                if now.minute == 0 and await self.scheduler_lease.renew():
                      await self._check_calendar_health()
                      await asyncio.sleep(61)
                 await asyncio.sleep(20)
@@ -869,19 +1886,25 @@ class GarbageBot:
                 self.log.error(f"Scheduler error: {e}")
                 await asyncio.sleep(60)
 
-    async def _send_reminders(self, date_str: str):
+    async def _send_reminders(self, day: date):
         configs = self.repo.get_all_configs()
         for jid_str, url, _, _, jid_blob in configs:
-            records = await self.sheet_service.get_records(url)
-            for r in records:
-                if str(r['Data']) == date_str:
-                    try:
-                        raw_jid = JID()
-                        raw_jid.ParseFromString(jid_blob)
-                        msg = f"🔔 *Reminder*\nCiao @{r['Telefono']}, ricordati che stasera tocca a te esporre il bidone della {r.get('Bidone','?')}"
-                        await self._send_private(raw_jid, msg)
-                    except Exception as e:
-                        self.log.error(f"Reminder fail for {jid_str}: {e}")
+            with tracer.trace("reminders", chat=jid_str):
+                try:
+                    await self._send_group_reminders(jid_str, url, jid_blob, day)
+                except Exception as e:
+                    self.log.error(f"Reminder saltati per {jid_str}: {e}")
+
+    async def _send_group_reminders(self, jid_str: str, url: str, jid_blob: bytes, day: date):
+        due = await self.group_jobs.run(jid_str, "reminders", url=url, day=day.toordinal())
+        for phone, bin_type in due:
+            try:
+                raw_jid = JID()
+                raw_jid.ParseFromString(jid_blob)
+                msg = f"🔔 *Reminder*\nCiao @{phone}, ricordati che stasera tocca a te esporre il bidone della {bin_type or '?'}"
+                await self._send_private(raw_jid, msg)
+            except Exception as e:
+                self.log.error(f"Reminder fail for {jid_str}: {e}")
 
     async def _check_calendar_health(self):
         configs = self.repo.get_all_configs()
@@ -890,20 +1913,108 @@ class GarbageBot:
             return
 
         for jid_str, url, _, _, _ in configs:
-            status = await self.calendar_service.manage_lifecycle(url)
+            # Passa dalla coda del gruppo per non sovrapporsi a un /genera in corso
+            try:
+                status = await self.dispatcher.submit(
+                    jid_str,
+                    lambda url=url, jid_str=jid_str: self._run_traced("lifecycle", lambda: self.group_jobs.run(jid_str, "lifecycle", url=url), chat=jid_str)
+                )
+            except Exception as e:
+                status = f"Errore ({e})"
             self.log.info(f"🔄 Stato {jid_str}: {status}")
 
+        self._start_warm_up()
+
+    # --- WARM-UP ---
+    def _start_warm_up(self):
+        if self._warm_up_task and not self._warm_up_task.done(): return
+        self._warm_up_task = asyncio.create_task(untraced(self._warm_up()))
+
+    async def _warm_up(self):
+        """Precarica sessioni, calendario, regole e (opzionale) PDF di ogni gruppo, senza competere con i comandi."""
+        configs = self.repo.get_all_configs()
+        if not configs: return
+        try:
+            await self.sheet_service.open_sessions()
+        except Exception as e:
+            self.log.warning(f"Warm-up sessioni fallito: {e}")
+
+        semaphore = asyncio.Semaphore(config.WARMUP_CONCURRENCY)
+
+        async def warm_group(jid_str: str, url: str):
+            async with semaphore:
+                # Bassa priorità: si aspetta che non ci siano comandi in corso
+                while self.dispatcher.busy:
+                    await asyncio.sleep(1)
+                with tracer.trace("warmup", chat=jid_str):
+                    try:
+                        await self.sheet_service.get_records(url, fresh=True)
+                        await self.sheet_service.get_rules(url, fresh=True)
+                        if config.WARMUP_PRERENDER_PDF and not self.dispatcher.busy:
+                            await self._render_pdf(jid_str, url)
+                    except Exception as e:
+                        self.log.warning(f"Warm-up fallito per {jid_str}: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(warm_group(jid_str, url) for jid_str, url, _, _, _ in configs))
+        self.log.info(f"🔥 Warm-up completato ({len(configs)} gruppi, {time.perf_counter() - started:.1f}s)")
+
+    async def _supervise_worker(self, index: int):
+        """Tiene vivo il worker `index`: se termina (crash o riavvio manuale) viene rilanciato, la sessione WhatsApp resta su."""
+        while True:
+            proc = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), "worker", str(index))
+            self._worker_procs[index] = proc
+            self.log.info(f"🧵 Worker {index} avviato (pid {proc.pid})")
+            code = await proc.wait()
+            self.log.warning(f"🧵 Worker {index} terminato (exit {code}), riavvio tra 5s")
+            await asyncio.sleep(5)
+
     async def start(self):
+        self._worker_tasks = [asyncio.create_task(self._supervise_worker(i)) for i in range(config.WORKERS)]
+        self._lease_task = asyncio.create_task(self.scheduler_lease.keep_alive())
         asyncio.create_task(self.scheduler_loop())
-        await self.client.connect()
-        await self.client.idle()
+        try:
+            await self.client.connect()
+            await self.client.idle()
+        finally:
+            self.stop()
+            await self.sheet_service.close()
+
+    def stop(self):
+        """Chiusura sincrona (usabile anche dal signal handler): worker terminati e lease dello scheduler rilasciato,
+        così un riavvio lo riprende subito invece di aspettarne la scadenza."""
+        for proc in self._worker_procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+        self.scheduler_lease.release()
+
+def setup_logging(trace_path: str):
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%d/%m/%Y %H:%M:%S')
+    # Gli span vanno solo sul file JSON; quelli lenti arrivano comunque in console tramite `SlowOps`
+    trace_log = logging.getLogger("Trace")
+    trace_log.propagate = False
+    trace_handler = RotatingFileHandler(trace_path, maxBytes=5 * 1024 * 1024, backupCount=2)
+    trace_handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_log.addHandler(trace_handler)
 
 if __name__ == "__main__":
-    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%d/%m/%Y %H:%M:%S')
+    if len(sys.argv) == 3 and sys.argv[1] == "worker":
+        # Un file di trace per processo: RotatingFileHandler non è sicuro tra processi
+        setup_logging(f"{config.TRACE_LOG_PATH}.worker{sys.argv[2]}")
+        try:
+            asyncio.run(run_worker(int(sys.argv[2]), config.WORKERS))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        sys.exit(0)
+
+    setup_logging(config.TRACE_LOG_PATH)
     bot = GarbageBot()
     def handle_exit(*args): sys.exit(0)
     signal.signal(signal.SIGINT, handle_exit)
+    signal.signal(signal.SIGTERM, handle_exit)
     try:
         bot.client.loop.run_until_complete(bot.start())
     except KeyboardInterrupt:
-        pass
\ No newline at end of file
+        pass
+    finally:
+        bot.stop()
\ No newline at end of file
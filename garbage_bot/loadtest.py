@@ -0,0 +1,429 @@
+"""
+Load test offline di GarbageBot.on_message.
+
+Genera eventi MessageEv sintetici (mix di comandi su molti gruppi e mittenti finti)
+e li invia al bot a un ritmo configurabile, usando backend finti per neonize e
+Google Sheets con latenza e tasso d'errore iniettabili. Nessuna connessione reale.
+
+Esempi:
+    python loadtest.py --groups 10,50,100,200 --rate 20 --duration 30
+    python loadtest.py --groups 50 --sheets-latency 2.0 --sheets-error-rate 0.2 --fake-pdf
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from neonize.proto.Neonize_pb2 import JID
+from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import DocumentMessage, Message
+
+import garbage_bot as gb
+
+DEFAULT_MIX = "oggi=40,prossimi=25,regole=10,info=5,calendario=15,genera=5"
+COMMAND_TEXT = {
+    "oggi": "/oggi",
+    "prossimi": "/prossimi",
+    "regole": "/regole",
+    "info": "/info",
+    "calendario": "/calendario",
+    "genera": "/genera",
+    "genera_nuovi": "/genera nuovi",
+}
+
+
+# --- BACKEND FINTI ---
+def make_jid(user: str, server: str) -> JID:
+    # Come in `_send_private`: neonize rifiuta la serializzazione senza i campi obbligatori
+    return JID(User=user, Server=server, Device=0, Integrator=0, RawAgent=0)
+
+class FaultInjector:
+    def __init__(self, latency: float, jitter: float, error_rate: float, rng: random.Random):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = rng
+        self.calls = 0
+        self.errors = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _maybe_fail(self, what: str):
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise RuntimeError(f"Errore iniettato ({what})")
+
+    async def io(self, what: str, scale: float = 1.0):
+        self.calls += 1
+        await asyncio.sleep(self._delay() * scale)
+        self._maybe_fail(what)
+
+
+class FakeSheetsApi:
+    """Stessa interfaccia di AsyncSheetsClient, su fogli in memoria."""
+    _A1 = re.compile(r"^([A-Z]+)?(\d+)?(?::([A-Z]+)?(\d+)?)?$")
+
+    def __init__(self, faults: FaultInjector, spreadsheets: Dict[str, Dict[str, List[List[str]]]]):
+        self.faults = faults
+        self.spreadsheets = spreadsheets
+
+    def _split(self, spreadsheet_id: str, a1: str) -> Tuple[List[List[str]], str]:
+        title, _, cells = a1.partition("!")
+        sheet = self.spreadsheets[spreadsheet_id].get(title.strip("'"))
+        if sheet is None:
+            raise gb.SheetsApiError(400, f"Unable to parse range: {a1}")
+        return sheet, cells
+
+    @staticmethod
+    def _col(letters: Optional[str], default: int) -> int:
+        if not letters: return default
+        n = 0
+        for ch in letters:
+            n = n * 26 + ord(ch) - 64
+        return n - 1
+
+    def _slice(self, sheet: List[List[str]], cells: str) -> List[List[str]]:
+        if not cells:
+            return [list(r) for r in sheet]
+        c1, r1, c2, r2 = self._A1.match(cells).groups()
+        col_start = self._col(c1, 0)
+        col_end = self._col(c2 or c1, 10_000) + 1
+        row_start = int(r1) - 1 if r1 else 0
+        row_end = int(r2) if r2 else (int(r1) if r1 and not c2 else len(sheet))
+        out = [r[col_start:col_end] for r in sheet[row_start:row_end]]
+        while out and not any(out[-1]):
+            out.pop()
+        return out
+
+    async def get_metadata(self, spreadsheet_id: str, fields: str = "sheets.properties") -> Dict[str, Any]:
+        await self.faults.io("metadata")
+        # sheetId = identità della lista di righe: resta uguale quando il foglio viene rinominato
+        return {"sheets": [{"properties": {"title": t, "sheetId": id(rows)}} for t, rows in self.spreadsheets[spreadsheet_id].items()]}
+
+    async def values_get(self, spreadsheet_id: str, a1: str) -> List[List[str]]:
+        await self.faults.io("values_get")
+        sheet, cells = self._split(spreadsheet_id, a1)
+        return self._slice(sheet, cells)
+
+    async def values_batch_get(self, spreadsheet_id: str, ranges: List[str]) -> List[List[List[str]]]:
+        await self.faults.io("values_batch_get")
+        return [self._slice(*self._split(spreadsheet_id, a1)) for a1 in ranges]
+
+    async def values_append(self, spreadsheet_id: str, a1: str, rows: List[List[Any]]) -> Dict[str, Any]:
+        await self.faults.io("values_append")
+        sheet, _ = self._split(spreadsheet_id, a1)
+        sheet.extend([[str(c) for c in r] for r in rows])
+        return {}
+
+    async def values_update(self, spreadsheet_id: str, a1: str, rows: List[List[Any]]) -> Dict[str, Any]:
+        await self.faults.io("values_update")
+        sheet, cells = self._split(spreadsheet_id, a1)
+        c1, r1, _, _ = self._A1.match(cells).groups()
+        col, row = self._col(c1, 0), int(r1) - 1 if r1 else 0
+        for i, values in enumerate(rows):
+            while len(sheet) <= row + i:
+                sheet.append([])
+            target = sheet[row + i]
+            target.extend([""] * (col + len(values) - len(target)))
+            target[col:col + len(values)] = [str(v) for v in values]
+        return {}
+
+    async def values_clear(self, spreadsheet_id: str, a1: str) -> Dict[str, Any]:
+        await self.faults.io("values_clear")
+        sheet, _ = self._split(spreadsheet_id, a1)
+        sheet.clear()
+        return {}
+
+    async def batch_update(self, spreadsheet_id: str, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        await self.faults.io("batch_update")
+        sheets = self.spreadsheets[spreadsheet_id]
+        by_id = {id(rows): title for title, rows in sheets.items()}
+        # Come Sheets: la batch viene validata per intero prima di applicare qualcosa
+        updated = dict(sheets)
+        for req in requests:
+            if "addSheet" in req:
+                title = req["addSheet"]["properties"]["title"]
+                if title in updated:
+                    raise gb.SheetsApiError(400, f"A sheet with the name \"{title}\" already exists")
+                updated[title] = []
+            elif "deleteSheet" in req:
+                updated.pop(by_id[req["deleteSheet"]["sheetId"]], None)
+            elif "updateSheetProperties" in req and "title" in req["updateSheetProperties"]["properties"]:
+                props = req["updateSheetProperties"]["properties"]
+                old = by_id[props["sheetId"]]
+                if props["title"] in updated and updated[props["title"]] is not sheets[old]:
+                    raise gb.SheetsApiError(400, f"A sheet with the name \"{props['title']}\" already exists")
+                updated[props["title"]] = updated.pop(old)
+                by_id[props["sheetId"]] = props["title"]
+        sheets.clear()
+        sheets.update(updated)
+        return {}
+
+    async def open(self):
+        await self.faults.io("token")
+
+    async def close(self):
+        pass
+
+
+class FakeCalendarService(gb.CalendarService):
+    """CalendarService con il rendering PDF eventualmente simulato (le scritture passano da FakeSheetsApi)."""
+
+    def __init__(self, sheet_service: gb.SheetService, faults: FaultInjector, fake_pdf: bool):
+        super().__init__(sheet_service)
+        self.faults = faults
+        self.fake_pdf = fake_pdf
+
+    def _convert_html_to_pdf(self, html: str) -> Optional[bytes]:
+        if self.fake_pdf:
+            time.sleep(0.05)
+            return b"%PDF-1.4 fake " + str(len(html)).encode()
+        return super()._convert_html_to_pdf(html)
+
+    def _merge_pdfs(self, fragments: List[bytes]) -> bytes:
+        if self.fake_pdf:
+            return b"".join(fragments)
+        return super()._merge_pdfs(fragments)
+
+
+class FakeWhatsApp:
+    """Sottoinsieme di NewAClient usato dal bot."""
+
+    def __init__(self, faults: FaultInjector, admins: Dict[str, str]):
+        self.faults = faults
+        self.admins = admins  # gruppo -> telefono admin
+        self.replies = 0
+        self.error_replies = 0
+        self.documents = 0
+        self.sent_documents = 0
+
+    def event(self, _ev_type):
+        return lambda fn: fn
+
+    async def get_me(self):
+        return SimpleNamespace(JID=make_jid("390000000000", "s.whatsapp.net"))
+
+    async def reply_message(self, text: str, msg: Any):
+        await self.faults.io("reply")
+        self.replies += 1
+        if text.startswith(("❌", "⛔")):
+            self.error_replies += 1
+
+    async def send_message(self, jid: JID, text: Optional[str] = None, message: Any = None):
+        await self.faults.io("send")
+        if message is not None:
+            self.sent_documents += 1
+
+    async def build_document_message(self, doc: bytes, filename: str, caption: str, mimetype: str):
+        # L'upload cresce con la dimensione del PDF (~1s per MB oltre alla latenza base)
+        await self.faults.io("upload", scale=1.0 + len(doc) / 1_000_000)
+        self.documents += 1
+        return Message(documentMessage=DocumentMessage(fileName=filename, caption=caption, mimetype=mimetype, fileLength=len(doc)))
+
+    async def get_group_info(self, jid: JID):
+        await self.faults.io("group_info")
+        admin = make_jid(self.admins.get(jid.User, ""), "s.whatsapp.net")
+        return SimpleNamespace(Participants=[SimpleNamespace(JID=admin, IsAdmin=True, IsSuperAdmin=False)])
+
+    async def get_group_invite_link(self, jid: JID) -> str:
+        await self.faults.io("invite_link")
+        return ""
+
+
+# --- DATI SINTETICI ---
+def build_spreadsheet(residents: int, weeks: int) -> Dict[str, List[List[str]]]:
+    people = [[f"Condomino {i + 1}", f"39300{i:07d}"] for i in range(residents)]
+    start = datetime.now().date() - timedelta(days=7 * (weeks // 2))
+    start -= timedelta(days=start.weekday())
+    calendar = [["Data", "Bidone", "Condomino", "Telefono"]]
+    for w in range(weeks):
+        name, phone = people[w % residents]
+        day = start + timedelta(days=7 * w)
+        calendar.append([day.strftime(gb.config.DATE_FORMAT), "plastica", name, phone])
+        calendar.append([(day + timedelta(days=1)).strftime(gb.config.DATE_FORMAT), "carta", name, phone])
+    return {
+        "Calendario": calendar,
+        "Impostazioni": [["Condomino", "Telefono"]] + people,
+        "Regole": [["Esporre i bidoni la sera prima della raccolta."], ["Plastica: lunedì"], ["Carta: martedì"]],
+    }
+
+
+def make_event(group: str, sender: str, text: str) -> Any:
+    return SimpleNamespace(
+        Message=SimpleNamespace(conversation=text, extendedTextMessage=SimpleNamespace(text="")),
+        Info=SimpleNamespace(MessageSource=SimpleNamespace(
+            Chat=make_jid(group, "g.us"),
+            Sender=make_jid(sender, "s.whatsapp.net"),
+            IsGroup=True,
+        )),
+    )
+
+
+def parse_mix(spec: str) -> Tuple[List[str], List[float]]:
+    names, weights = [], []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in COMMAND_TEXT:
+            raise SystemExit(f"Comando sconosciuto nel mix: {name} (validi: {', '.join(COMMAND_TEXT)})")
+        names.append(name)
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+# --- MISURE ---
+def percentile(values: List[float], q: float) -> float:
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.05):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - t0 - interval))
+
+
+async def run_level(args: argparse.Namespace, n_groups: int) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    sheets_faults = FaultInjector(args.sheets_latency, args.sheets_jitter, args.sheets_error_rate, rng)
+    wa_faults = FaultInjector(args.wa_latency, args.wa_jitter, args.wa_error_rate, rng)
+
+    groups = [f"1203630{i:011d}" for i in range(n_groups)]
+    senders = {g: [f"39333{i:03d}{j:04d}" for j in range(args.senders)] for i, g in enumerate(groups)}
+    spreadsheets = {f"sheet{i:05d}": build_spreadsheet(args.residents, args.weeks) for i in range(n_groups)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = gb.ConfigRepository(os.path.join(tmp, "config.sqlite"))
+        for i, g in enumerate(groups):
+            url = f"https://docs.google.com/spreadsheets/d/sheet{i:05d}/edit"
+            repo.upsert_config(make_jid(g, "g.us"), url, "", f"Gruppo {i}")
+
+        sheet_service = gb.SheetService(os.path.join(tmp, "credentials.json"))
+        sheet_service.api = FakeSheetsApi(sheets_faults, spreadsheets)
+        calendar_service = FakeCalendarService(sheet_service, sheets_faults, args.fake_pdf)
+        client = FakeWhatsApp(wa_faults, {g: senders[g][0] for g in groups})
+        bot = gb.GarbageBot(client=client, repo=repo, sheet_service=sheet_service, calendar_service=calendar_service)
+
+        if args.warm_up:
+            await bot._warm_up()
+
+        names, weights = parse_mix(args.mix)
+        latencies: Dict[str, List[float]] = {n: [] for n in names}
+        counters = {"sent": 0, "done": 0, "timeouts": 0, "errors": 0}
+        lag: List[float] = []
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(monitor_loop_lag(lag, stop))
+        inflight = asyncio.Semaphore(args.concurrency)
+        tasks = set()
+
+        async def fire(name: str, ev: Any):
+            t0 = time.perf_counter()
+            try:
+                fut = await bot.on_message(client, ev)
+                if fut is not None:
+                    await asyncio.wait_for(asyncio.shield(fut), timeout=args.timeout)
+                latencies[name].append(time.perf_counter() - t0)
+                counters["done"] += 1
+            except asyncio.TimeoutError:
+                counters["timeouts"] += 1
+            except Exception:
+                counters["errors"] += 1
+            finally:
+                inflight.release()
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        interval = 1.0 / args.rate
+        i = 0
+        while loop.time() - started < args.duration:
+            await inflight.acquire()
+            name = rng.choices(names, weights)[0]
+            group = rng.choice(groups)
+            ev = make_event(group, rng.choice(senders[group]), COMMAND_TEXT[name])
+            task = asyncio.create_task(fire(name, ev))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            counters["sent"] += 1
+            i += 1
+            await asyncio.sleep(max(0.0, started + i * interval - loop.time()))
+
+        if tasks:
+            await asyncio.wait(tasks)
+        elapsed = loop.time() - started
+        stop.set()
+        await lag_task
+
+    return {
+        "groups": n_groups,
+        "elapsed": elapsed,
+        "counters": counters,
+        "latencies": latencies,
+        "lag": lag,
+        "sheets_calls": sheets_faults.calls,
+        "sheets_errors": sheets_faults.errors,
+        "wa_calls": wa_faults.calls,
+        "wa_errors": wa_faults.errors,
+        "error_replies": client.error_replies,
+        "uploads": client.documents,
+        "documents": client.sent_documents,
+    }
+
+
+def print_report(r: Dict[str, Any]):
+    c = r["counters"]
+    print(f"\n=== {r['groups']} gruppi · {r['elapsed']:.1f}s ===")
+    print(f"Inviati {c['sent']} · completati {c['done']} · timeout {c['timeouts']} · eccezioni {c['errors']} · risposte d'errore {r['error_replies']}")
+    print(f"Throughput: {c['done'] / r['elapsed']:.1f} comandi/s")
+    print(f"Sheets: {r['sheets_calls']} chiamate ({r['sheets_errors']} errori) · WhatsApp: {r['wa_calls']} chiamate ({r['wa_errors']} errori)")
+    print(f"Documenti inviati: {r['documents']} · upload: {r['uploads']}")
+    print(f"{'comando':<14}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, values in r["latencies"].items():
+        if not values: continue
+        print(f"{name:<14}{len(values):>6}" + "".join(f"{percentile(values, q) * 1000:>7.0f}ms" for q in (0.5, 0.95, 0.99, 1.0)))
+    lag = r["lag"]
+    print(f"Lag event loop: p50 {percentile(lag, 0.5) * 1000:.1f}ms · p99 {percentile(lag, 0.99) * 1000:.1f}ms · max {max(lag, default=0) * 1000:.1f}ms")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Load test offline di GarbageBot.on_message con backend finti.")
+    p.add_argument("--groups", default="10", help="Numero di gruppi, o lista separata da virgole per uno sweep (es. 10,50,100)")
+    p.add_argument("--senders", type=int, default=5, help="Mittenti per gruppo (il primo è admin)")
+    p.add_argument("--rate", type=float, default=10.0, help="Messaggi al secondo (open loop)")
+    p.add_argument("--duration", type=float, default=20.0, help="Durata di ogni livello in secondi")
+    p.add_argument("--concurrency", type=int, default=200, help="Massimo comandi in volo")
+    p.add_argument("--timeout", type=float, default=60.0, help="Timeout per comando in secondi")
+    p.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesi dei comandi (default: {DEFAULT_MIX})")
+    p.add_argument("--residents", type=int, default=12, help="Condomini per foglio")
+    p.add_argument("--weeks", type=int, default=104, help="Settimane di calendario per foglio")
+    p.add_argument("--sheets-latency", type=float, default=0.3)
+    p.add_argument("--sheets-jitter", type=float, default=0.1)
+    p.add_argument("--sheets-error-rate", type=float, default=0.0)
+    p.add_argument("--wa-latency", type=float, default=0.15)
+    p.add_argument("--wa-jitter", type=float, default=0.05)
+    p.add_argument("--wa-error-rate", type=float, default=0.0)
+    p.add_argument("--warm-up", action="store_true", help="Esegue il warm-up del bot prima del carico")
+    p.add_argument("--fake-pdf", action="store_true", help="Non renderizzare davvero i PDF (xhtml2pdf)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--verbose", action="store_true")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not args.verbose:
+        logging.getLogger("Trace").setLevel(logging.ERROR)
+
+    for n in [int(x) for x in args.groups.split(",")]:
+        print_report(asyncio.run(run_level(args, n)))
+
+
+if __name__ == "__main__":
+    main()